@@ -0,0 +1,6 @@
+# `python -m app`, app.main itself is imported by the package first
+from app.main import run
+
+
+if __name__ == "__main__":
+    run()
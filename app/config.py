@@ -1,33 +1,183 @@
-import secrets
+import os
 
 from sqlmodel import create_engine
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+import app.rate_limit  # registers the sqlite:// limiter storage
+from app.metrics import instrument_engine
+
 
 DEBUG = False
 
 
-SECRET_KEY = secrets.token_urlsafe(64)
+# JWT key ring, a JSON {"active": kid, "keys": {kid: secret}} given in
+# APP_JWT_KEYS or kept in JWT_KEYS_FILE, which is created on first start.
+# Every worker and restart shares it, see app/rotate_keys.py for rotation.
+JWT_KEYS = os.environ.get("APP_JWT_KEYS")
+JWT_KEYS_FILE = os.environ.get("APP_JWT_KEYS_FILE", "jwt_keys.json")
 TOKEN_ALGORITHM = "HS256"
 
 # Time by minutes
 TOKEN_EXPIRED_TIME = 20
+# Time by days, refresh tokens are single use and replaced on every refresh
+REFRESH_TOKEN_EXPIRED_TIME = 30
+
+# bcrypt work factor, hashes made with another cost are rehashed on next login
+BCRYPT_ROUNDS = 12
+# threads that run bcrypt and how many extra calls may wait for them,
+# anything beyond that is rejected with 503 instead of piling up
+PASSWORD_WORKERS = 4
+PASSWORD_QUEUE_LIMIT = 16
 
 ORIGINS = [
     "https://localhost:8000",
 ]
 
+# Authenticated users are cached per process by id. Writes through the
+# users router change the user's slot in USER_CACHE_FILE, which every
+# worker on the host maps and checks before it uses a cached user.
+USER_CACHE_SIZE = 1024
+# Time by seconds
+USER_CACHE_TTL = 60
+USER_CACHE_FILE = os.environ.get("APP_USER_CACHE_FILE", ".cache/user_generations")
+USER_CACHE_SLOTS = 4096
+
+# Bulk NDJSON import, rows per transaction and the longest accepted line
+BULK_BATCH_SIZE = 1000
+# Size by bytes
+BULK_MAX_LINE = 1024 * 1024
+
+# Bulk user import hashes passwords on a pool of its own, bcrypt releases
+# the GIL so its threads use every core, and inserts BULK_BATCH_SIZE users
+# per transaction.
+PROVISION_WORKERS = int(os.environ.get("APP_PROVISION_WORKERS", os.cpu_count() or 1))
+
+# Public article responses are cached already encoded, "memory" keeps them
+# per worker, "file" shares RESPONSE_CACHE_DIR between the workers of a host
+# and None turns the cache off.
+RESPONSE_CACHE_BACKEND = "memory"
+RESPONSE_CACHE_DIR = ".cache/responses"
+# Size by bytes, the file backend removes the oldest files beyond it
+RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
+# Time by seconds
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_GZIP = True
+
+# Article content storage: None keeps plain text, "zlib" stores deflate
+# data that get_article sends to gzip clients as is, "zstd" compresses
+# better (with an optional trained dictionary) but is always decompressed
+# to serve, it falls back to zlib where zstandard is not installed.
+CONTENT_COMPRESSION = os.environ.get("APP_CONTENT_COMPRESSION")
+CONTENT_COMPRESSION_LEVEL = 6
+CONTENT_DICTIONARY = os.environ.get("APP_CONTENT_DICTIONARY")
+
+# The newest FEED_SIZE articles of the front page and of the FEED_AUTHORS
+# most recently read author pages are kept in memory per worker and updated
+# by its writes, deeper pages go to the database. With the "file" response
+# cache a change of its list version by any worker reloads them.
+FEED_SIZE = 100
+FEED_AUTHORS = 1024
+# Time by seconds
+FEED_TTL = 60
+
+# Article reads are counted in memory per worker and added to the database
+# in one transaction every VIEW_FLUSH_INTERVAL seconds, or sooner once
+# VIEW_FLUSH_EVENTS reads are waiting.
+# Time by seconds
+VIEW_FLUSH_INTERVAL = 5
+VIEW_FLUSH_EVENTS = 1000
+
+# Cache-Control sent by each cached route, along with its ETag
+CACHE_CONTROL = {
+    "articles_list": "public, max-age=10",
+    "get_article": "public, max-age=60",
+    # counts only change once per VIEW_FLUSH_INTERVAL anyway
+    "most_read_articles": "public, max-age=5",
+}
+
+# A request carrying PROFILE_HEADER is profiled when DEBUG is on or it has
+# an admin token. The report is written to PROFILE_DIR and its name sent back
+# in the same header.
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = ".cache/profiles"
+# Time by seconds, between two stack samples
+PROFILE_INTERVAL = 0.001
+
+# List responses are encoded straight from the rows with orjson (json where
+# it is not installed) instead of being validated into their models first,
+# "1" turns it on. FastJSONResponse becomes the default response class too.
+FAST_JSON = os.environ.get("APP_FAST_JSON") == "1"
+
 # the count of object in each page
 PAGINATION = 10
+# the largest page a client may ask for
+MAX_PAGINATION = 100
 
 if DEBUG:
     SQLITE_FILE_NAME = "test.db"
 else:
-    SQLITE_FILE_NAME = "database.db"
+    SQLITE_FILE_NAME = os.environ.get("APP_DATABASE", "database.db")
 
 SQLITE_URL = f"sqlite:///{SQLITE_FILE_NAME}"
+ASYNC_SQLITE_URL = f"sqlite+aiosqlite:///{SQLITE_FILE_NAME}"
+
+# Applied to every new connection, WAL lets readers run next to the single
+# writer and busy_timeout makes writers wait instead of "database is locked".
+# An empty dict keeps SQLite defaults.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    # negative values are KiB
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+SQLITE_POOL = {
+    "pool_size": 8,
+    "max_overflow": 8,
+    "pool_timeout": 30,
+}
+
+
+def tune_sqlite(engine: Engine, pragmas: dict = SQLITE_PRAGMAS) -> Engine:
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+# Sync engine for scripts (create_admin) and test fixtures,
+# the application itself only talks to async_engine.
+engine = tune_sqlite(create_engine(SQLITE_URL, **SQLITE_POOL))
+async_engine = create_async_engine(ASYNC_SQLITE_URL, **SQLITE_POOL)
+instrument_engine(tune_sqlite(async_engine.sync_engine))
+
+# Rate limit counters, "sqlite:///file" is shared by all workers on the
+# host, "memory://" keeps them per process
+RATE_LIMIT_STORAGE = os.environ.get(
+    "APP_RATE_LIMIT_STORAGE", "sqlite:///rate_limits.db",
+)
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE)
 
-engine = create_engine(SQLITE_URL)
 
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+# Production server, `python -m app`
+SERVER_HOST = os.environ.get("APP_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("APP_PORT", 8000))
+SERVER_WORKERS = int(os.environ.get("APP_WORKERS", os.cpu_count() or 1))
+# "auto" falls back to asyncio and h11 where uvloop or httptools are missing
+SERVER_LOOP = os.environ.get("APP_LOOP", "uvloop")
+SERVER_HTTP = os.environ.get("APP_HTTP", "httptools")
+SERVER_BACKLOG = int(os.environ.get("APP_BACKLOG", 2048))
+# Time by seconds
+SERVER_KEEP_ALIVE = int(os.environ.get("APP_KEEP_ALIVE", 5))
+SERVER_GRACEFUL_SHUTDOWN = int(os.environ.get("APP_GRACEFUL_SHUTDOWN", 30))
+# a worker exits after this many requests and is replaced, 0 never recycles
+SERVER_MAX_REQUESTS = int(os.environ.get("APP_MAX_REQUESTS", 0))
@@ -1,3 +1,5 @@
+import asyncio
+
 from sqlmodel import SQLModel, Session, select
 
 from app.config import engine
@@ -27,9 +29,9 @@ def create_admin_user() -> None:
     password = input("Secure password: ")
 
     user_login = UserLogin(username=username, password=password)
-    create_user(
+    asyncio.run(create_user(
         user_login=user_login, permission=UserPermission.admin,
-    )
+    ))
 
 
 if __name__ == "__main__":
@@ -1,23 +1,48 @@
 from . import models
 from .models import (
     Article,
+    ArticleView,
     ArticleList,
+    ArticleRead,
+    ArticleSearch,
     ArticleBase,
+    ArticlePatch,
     UserBase,
+    RefreshToken,
+    RefreshRequest,
     BasePassword,
     UserLogin,
+    UserImport,
     UserPermission,
     UserPermissionInfo,
     UserInfo,
+    UserInfoPatch,
 )
 from .utils import (
+    new_session,
     get_session,
     SessionDep,
     password_hasher,
     auth_password,
     AuthDep,
+    key_ring,
     create_token,
+    create_refresh_token,
+    refresh_token,
+    revoke_refresh_tokens,
     auth_token,
     TokenValidateDep,
     create_user,
-)
\ No newline at end of file
+    user_cache,
+    invalidate_user,
+)
+from .pagination import encode_cursor, decode_cursor, next_link
+from .search import (
+    search_table,
+    search_column,
+    match_expression,
+    create_search_index,
+    rebuild_search_index,
+)
+from .export import EXPORT_FORMATS, export_articles
+from .provision import IMPORT_FORMATS, import_users
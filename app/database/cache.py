@@ -0,0 +1,85 @@
+import mmap
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+        }
+
+
+class SharedGenerations:
+    # Eight bytes per slot in a file every worker on the host maps. bump()
+    # gives a key's slot a new random value, so a worker can tell an entry
+    # cached under the old one is stale without asking the database. Keys
+    # sharing a slot only cost each other a reload.
+
+    SLOT_SIZE = 8
+
+    def __init__(self, path: str, slots: int) -> None:
+        self.slots = slots
+        size = slots * self.SLOT_SIZE
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # new pages are zeros, slots written by other workers are kept
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _offset(self, key: uuid.UUID) -> int:
+        return key.int % self.slots * self.SLOT_SIZE
+
+    def get(self, key: uuid.UUID) -> bytes:
+        offset = self._offset(key)
+        return self._map[offset:offset + self.SLOT_SIZE]
+
+    def bump(self, key: uuid.UUID) -> None:
+        offset = self._offset(key)
+        self._map[offset:offset + self.SLOT_SIZE] = os.urandom(self.SLOT_SIZE)
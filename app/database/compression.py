@@ -0,0 +1,146 @@
+import json
+import struct
+import zlib
+
+from sqlalchemy import Engine, Text, event
+from sqlalchemy.types import TypeDecorator
+
+from app.config import (
+    CONTENT_COMPRESSION,
+    CONTENT_COMPRESSION_LEVEL,
+    CONTENT_DICTIONARY,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Stored values start with a tag byte, plain text rows are left as TEXT.
+# Deflate rows hold the JSON encoded string (quotes and escapes included)
+# as raw deflate data ending on a sync flush, so get_article can splice
+# them into a gzip response unchanged. The CRC32 and length of that string
+# are kept in front of it for the gzip trailer.
+DEFLATE_TAG = b"z"
+ZSTD_TAG = b"s"
+DEFLATE_HEADER = struct.Struct("!II")
+
+
+def load_dictionary(path: str | None):
+    if path is None or zstandard is None:
+        return None
+    with open(path, "rb") as file:
+        return zstandard.ZstdCompressionDict(file.read())
+
+
+zstd_dictionary = load_dictionary(CONTENT_DICTIONARY)
+
+
+def compress_content(text: str, method: str | None) -> str | bytes:
+    if method == "zstd" and zstandard is not None:
+        compressor = zstandard.ZstdCompressor(
+            level=CONTENT_COMPRESSION_LEVEL, dict_data=zstd_dictionary,
+        )
+        return ZSTD_TAG + compressor.compress(text.encode())
+    if method in ("zlib", "zstd"):
+        data = json.dumps(text, ensure_ascii=False).encode()
+        compressor = zlib.compressobj(CONTENT_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return (
+            DEFLATE_TAG + DEFLATE_HEADER.pack(zlib.crc32(data), len(data)) + deflated
+        )
+    return text
+
+
+def decompress_content(value: str | bytes | None) -> str | None:
+    if value is None or isinstance(value, str):
+        return value
+
+    tag, data = value[:1], value[1:]
+    if tag == DEFLATE_TAG:
+        data = zlib.decompressobj(-15).decompress(data[DEFLATE_HEADER.size:])
+        return json.loads(data)
+    if tag == ZSTD_TAG:
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read this article content.")
+        decompressor = zstandard.ZstdDecompressor(dict_data=zstd_dictionary)
+        return decompressor.decompress(data).decode()
+    raise ValueError(f"Unknown content encoding {tag!r}.")
+
+
+class CompressedText(TypeDecorator):
+    # Text compressed on write when a method is set, zstd falls back to
+    # zlib where the zstandard package is missing. Reads accept every
+    # stored form, so the method can change without rewriting old rows.
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, method: str | None = None) -> None:
+        super().__init__()
+        self.method = method
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_content(value, self.method)
+
+    def process_result_value(self, value, dialect):
+        return decompress_content(value)
+
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    # CRC32 of a + b from crc32(a), crc32(b) and len(b). CRC32 is affine,
+    # running either start value over b differs by what running them over
+    # as many zeros does, which zlib computes in C without b.
+    zeros = bytes(length2)
+    return zlib.crc32(zeros, crc1) ^ zlib.crc32(zeros) ^ crc2
+
+
+def gzip_around(head: bytes, stored: bytes, tail: bytes) -> bytes | None:
+    # One gzip member for head + content + tail where the content is the
+    # stored deflate data as is, None when the row is not stored that way.
+    # The trailer is built from the stored CRC32 and length, the content
+    # is never inflated.
+    if not isinstance(stored, bytes) or stored[:1] != DEFLATE_TAG:
+        return None
+
+    content_crc, content_length = DEFLATE_HEADER.unpack_from(stored, 1)
+    deflated = stored[1 + DEFLATE_HEADER.size:]
+    crc = crc32_combine(zlib.crc32(head), content_crc, content_length)
+    crc = zlib.crc32(tail, crc)
+    head_compressor = zlib.compressobj(CONTENT_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    tail_compressor = zlib.compressobj(CONTENT_COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    return b"".join((
+        GZIP_HEADER,
+        head_compressor.compress(head),
+        head_compressor.flush(zlib.Z_SYNC_FLUSH),
+        deflated,
+        tail_compressor.compress(tail),
+        tail_compressor.flush(zlib.Z_FINISH),
+        struct.pack(
+            "<II", crc, (len(head) + content_length + len(tail)) & 0xFFFFFFFF,
+        ),
+    ))
+
+
+def content_json(stored: str | bytes | None) -> bytes:
+    # the JSON string of a stored value, for building a body around it
+    if isinstance(stored, bytes) and stored[:1] == DEFLATE_TAG:
+        return zlib.decompressobj(-15).decompress(stored[1 + DEFLATE_HEADER.size:])
+    return json.dumps(decompress_content(stored), ensure_ascii=False).encode()
+
+
+@event.listens_for(Engine, "connect")
+def register_functions(dbapi_connection, connection_record):
+    # the search index and its triggers read content through article_text()
+    dbapi_connection.create_function(
+        "article_text", 1, decompress_content, deterministic=True,
+    )
+
+
+content_type = CompressedText(CONTENT_COMPRESSION)
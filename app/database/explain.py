@@ -0,0 +1,59 @@
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Connection
+from sqlmodel import select
+
+from app.database import Article, UserBase, UserPermission, encode_cursor
+
+
+# a child of uvicorn's logger so plans show up in the server output
+logger = logging.getLogger("uvicorn.error").getChild("explain")
+
+
+def hot_queries() -> dict:
+    # imported here, the routers depend on this package
+    from app.routers.articles import Pagination, articles_page, most_read_page
+    from app.routers.users import users_query
+
+    cursor = encode_cursor(datetime.now().isoformat(), uuid.uuid4())
+    return {
+        "articles_list": articles_page(Pagination()),
+        "articles_list_cursor": articles_page(Pagination(cursor=cursor)),
+        "articles_list_author": articles_page(Pagination(cursor=cursor), "author"),
+        "get_article": select(Article).
+            where(Article.title == "title").
+            where(Article.id == uuid.uuid4()),
+        "most_read_articles": most_read_page(10),
+        "auth_password": select(UserBase).where(UserBase.username == "user"),
+        "auth_token": select(UserBase).where(UserBase.id == uuid.uuid4()),
+        "users_permission": users_query(None, None).limit(10),
+        "users_permission_prefix": users_query(UserPermission.staff, "user", "user1").
+            limit(10),
+    }
+
+
+def query_plans(conn: Connection) -> dict[str, list[str]]:
+    plans = {}
+    for name, query in hot_queries().items():
+        compiled = query.compile(dialect=conn.dialect)
+        # bound values do not change the chosen plan, NULL stands in for them
+        params = tuple(None for _ in compiled.positiontup or ())
+        rows = conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}", params,
+        ).all()
+        plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+def is_full_scan(step: str) -> bool:
+    # "SCAN article" reads the whole table, "SCAN article USING INDEX" does not
+    return step.startswith("SCAN") and "INDEX" not in step
+
+
+def log_query_plans(conn: Connection) -> None:
+    for name, steps in query_plans(conn).items():
+        logger.info("Query plan %s: %s", name, " | ".join(steps))
+        for step in filter(is_full_scan, steps):
+            logger.warning("Full table scan in %s: %s", name, step)
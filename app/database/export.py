@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from sqlmodel import select
+
+from app.database import Article, new_session
+
+
+EXPORT_COLUMNS = [
+    "id", "title", "pub_date", "last_mod", "author", "summary", "content",
+]
+# rows pulled from the cursor at a time, memory stays flat whatever the size
+EXPORT_CHUNK_ROWS = 500
+
+
+async def published_articles() -> AsyncIterator[dict]:
+    async with new_session() as session:
+        result = await session.stream(
+            select(*(getattr(Article, name) for name in EXPORT_COLUMNS)).
+                where(Article.pub_date <= datetime.now()).
+                execution_options(yield_per=EXPORT_CHUNK_ROWS)
+        )
+        async for row in result.mappings():
+            # same text forms the JSON API uses
+            yield {
+                name: value.isoformat() if isinstance(value, datetime) else str(value)
+                for name, value in row.items()
+            }
+
+
+async def ndjson_chunks(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield json.dumps(row).encode() + b"\n"
+
+
+async def csv_chunks(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level=6, wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+    "csv": ("text/csv", csv_chunks),
+}
+
+
+def export_articles(format: str, compress: bool) -> AsyncIterator[bytes]:
+    chunks = EXPORT_FORMATS[format][1](published_articles())
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException, status
+
+from app.config import BCRYPT_ROUNDS, PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT
+
+
+class PasswordPool:
+    def __init__(self, workers: int, queue_limit: int) -> None:
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt",
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    async def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later.",
+                headers={"Retry-After": "1"},
+            )
+
+        try:
+            future = self._executor.submit(func, *args)
+        except:
+            self._slots.release()
+            raise
+        # the slot is held until bcrypt finishes, even if the caller is gone
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+password_pool = PasswordPool(PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT)
+
+
+def hash_password(passwd: bytes, rounds: int = BCRYPT_ROUNDS) -> bytes:
+    return bcrypt.hashpw(passwd, bcrypt.gensalt(rounds))
+
+
+def needs_rehash(pw_hash: bytes, rounds: int = BCRYPT_ROUNDS) -> bool:
+    # bcrypt hashes look like b"$2b$12$<salt+hash>"
+    try:
+        return int(pw_hash.split(b"$")[2]) != rounds
+    except (IndexError, ValueError):
+        return True
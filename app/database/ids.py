@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    # RFC 9562 version 7: 48 bits of unix milliseconds, then 12 bits used
+    # as a counter within the millisecond and 62 random bits, so ids made
+    # by one process always sort in creation order.
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2)) & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+
+    value = (
+        (timestamp & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | int.from_bytes(os.urandom(8)) & 0x3FFF_FFFF_FFFF_FFFF
+    )
+    return uuid.UUID(int=value)
+
+
+class UUIDBlob(TypeDecorator):
+    # UUIDs as 16 raw bytes instead of 32 hex characters. Byte order is the
+    # order of the UUID, so version 7 keys sort by time in the index too.
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # rows written before the migration to BLOBs hold hex text
+        if isinstance(value, str):
+            return uuid.UUID(value)
+        return uuid.UUID(bytes=value)
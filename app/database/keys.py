@@ -0,0 +1,104 @@
+import json
+import os
+import secrets
+import threading
+import time
+
+
+class KeyRing:
+    # JWT signing keys shared by every worker and kept across restarts.
+    # The ring is a JSON object {"active": kid, "keys": {kid: secret}},
+    # taken from an environment variable or a file. The active key signs,
+    # every key in the ring verifies, so rotating only means adding a key,
+    # making it active and dropping the old one once its tokens expired.
+    # The file is stat()ed at most once per check_interval seconds.
+
+    def __init__(
+        self, path: str, env_value: str | None = None, check_interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.env_value = env_value
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if self.env_value:
+            ring = json.loads(self.env_value)
+        else:
+            ring = self._read_or_create()
+        keys, active_kid = dict(ring["keys"]), ring["active"]
+        if active_kid not in keys:
+            raise ValueError(f"Active JWT key {active_kid!r} is not in the ring.")
+        # one assignment, a concurrent reader sees the old or the new ring
+        # and never the active kid of one with the keys of the other
+        self._ring = (active_kid, keys)
+
+    @property
+    def active_kid(self) -> str:
+        return self._ring[0]
+
+    @property
+    def keys(self) -> dict[str, str]:
+        return self._ring[1]
+
+    def _read_or_create(self) -> dict:
+        if not os.path.exists(self.path):
+            # written in full under another name and linked into place, a
+            # worker starting at the same time never reads a partial file,
+            # and link fails for all but the first
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump(new_ring(), file)
+            try:
+                os.link(tmp, self.path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp)
+
+        with open(self.path) as file:
+            # the mtime of the file that was read, not of a later rotation
+            self._mtime = os.fstat(file.fileno()).st_mtime_ns
+            ring = json.load(file)
+        return ring
+
+    def signing_key(self) -> tuple[str, str]:
+        if self._file_changed():
+            self.reload()
+        active_kid, keys = self._ring
+        return active_kid, keys[active_kid]
+
+    def verification_key(self, kid: str | None) -> str | None:
+        if self._file_changed():
+            # keys added or dropped by rotation after this worker started
+            self.reload()
+        return self.keys.get(kid)
+
+    def reload(self) -> None:
+        with self._lock:
+            self._load()
+
+    def _file_changed(self) -> bool:
+        if self.env_value:
+            return False
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except FileNotFoundError:
+            return False
+
+
+def new_key_id() -> str:
+    return secrets.token_hex(8)
+
+
+def new_ring() -> dict:
+    kid = new_key_id()
+    return {"active": kid, "keys": {kid: secrets.token_urlsafe(64)}}
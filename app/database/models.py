@@ -2,20 +2,42 @@ import uuid
 from enum import Enum
 from datetime import datetime
 
-from sqlmodel import SQLModel, Field, Column, Text
+from sqlmodel import SQLModel, Field, Column, Index
 from pydantic import BaseModel, Field as PField
 
+from app.database.ids import UUIDBlob, uuid7
+from app.database.compression import content_type
+
 
 class Article(SQLModel, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    __table_args__ = (
+        # keyset pagination of articles_list walks this index backwards,
+        # pub_date is carried along so unpublished rows are skipped in-index
+        Index("ix_article_last_mod_id", "last_mod", "id", "pub_date"),
+        # the same walk for one author, deep pages of the author feeds
+        Index("ix_article_author_last_mod_id", "author", "last_mod", "id", "pub_date"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True, sa_type=UUIDBlob)
     title: str = Field(max_length=64)
-    pub_date: datetime = Field(default_factory=datetime.now, const=True)
+    pub_date: datetime = Field(
+        default_factory=datetime.now, const=True, index=True,
+    )
     last_mod: datetime = Field(default_factory=datetime.now)
     author: str
-    content: str = Field(sa_column=Column(Text))
+    content: str = Field(sa_column=Column(content_type))
     summary: str
 
 
+class ArticleView(SQLModel, table=True):
+    # read counts, added up in memory and written in batches by
+    # app.view_counter, the views index serves the most read list
+    article_id: uuid.UUID = Field(
+        foreign_key="article.id", primary_key=True, sa_type=UUIDBlob,
+    )
+    views: int = Field(default=0, index=True)
+
+
 class ArticleList(BaseModel):
     id: uuid.UUID
     title: str
@@ -23,6 +45,14 @@ class ArticleList(BaseModel):
     last_mod: datetime
 
 
+class ArticleRead(ArticleList):
+    views: int
+
+
+class ArticleSearch(ArticleList):
+    snippet: str
+
+
 class ArticleBase(BaseModel):
     title: str = PField(max_length=64)
     last_mod: datetime = PField(default_factory=datetime.now)
@@ -31,6 +61,15 @@ class ArticleBase(BaseModel):
     summary: str
 
 
+class ArticlePatch(BaseModel):
+    title: str | None = PField(default=None, max_length=64)
+    author: str | None = None
+    content: str | None = None
+    summary: str | None = None
+    # the last_mod the client read, the update is refused if it moved on
+    last_mod: datetime
+
+
 class UserPermission(Enum):
     guest = "guest"
     staff = "staff"
@@ -38,14 +77,24 @@ class UserPermission(Enum):
 
 
 class UserBase(SQLModel, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    id: uuid.UUID = Field(default_factory=uuid7, primary_key=True, sa_type=UUIDBlob)
     f_name: str | None = Field(default=None, max_length=32)
     l_name: str | None = Field(default=None, max_length=32)
-    username: str = Field(max_length=32, primary_key=True)
+    username: str = Field(max_length=32, unique=True, index=True)
     password_hash: bytes = Field(max_length=64)
     permission: UserPermission = Field(default=UserPermission.guest)
 
 
+class RefreshToken(SQLModel, table=True):
+    # only the sha256 of the token is kept, it is random enough that a
+    # slow hash buys nothing, and it is the primary key for the lookup
+    token_hash: str = Field(max_length=64, primary_key=True)
+    user_id: uuid.UUID = Field(
+        foreign_key="userbase.id", index=True, sa_type=UUIDBlob,
+    )
+    expires: datetime
+
+
 
 class BasePassword(BaseModel):
     password: str = PField(min_length=8, max_length=32)
@@ -56,6 +105,16 @@ class UserLogin(BasePassword):
 
 
 
+class UserImport(UserLogin):
+    permission: UserPermission = PField(default=UserPermission.guest)
+    f_name: str | None = PField(default=None, max_length=32)
+    l_name: str | None = PField(default=None, max_length=32)
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class UserInfo(BaseModel):
     id: uuid.UUID
     username: str
@@ -63,6 +122,12 @@ class UserInfo(BaseModel):
     l_name: str | None = PField(default=None)
 
 
+class UserInfoPatch(BaseModel):
+    username: str | None = PField(default=None, max_length=32)
+    f_name: str | None = PField(default=None, max_length=32)
+    l_name: str | None = PField(default=None, max_length=32)
+
+
 class UserPermissionInfo(BaseModel):
     id: uuid.UUID
     username: str
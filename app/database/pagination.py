@@ -0,0 +1,32 @@
+import base64
+import binascii
+
+from fastapi import HTTPException, status
+
+
+# Cursors are opaque to clients: the sort key of the last row they saw,
+# joined and base64 encoded. Routers turn the parts back into typed values.
+def encode_cursor(*values) -> str:
+    raw = "|".join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parts: int) -> list[str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = raw.decode().split("|", parts - 1)
+    except (binascii.Error, UnicodeDecodeError):
+        values = []
+
+    if len(values) != parts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+    return values
+
+
+def next_link(url) -> str:
+    # path and query only, the host comes from the client's Host header and
+    # cached responses are shared between clients
+    return f'<{url.path}?{url.query}>; rel="next"'
@@ -0,0 +1,161 @@
+import asyncio
+import csv
+import time
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from app import ndjson
+from app.config import BULK_BATCH_SIZE, PROVISION_WORKERS
+from app.database import UserBase, UserImport, new_session
+from app.database.hashing import hash_password
+
+
+provision_pool = ThreadPoolExecutor(
+    max_workers=PROVISION_WORKERS, thread_name_prefix="provision",
+)
+
+
+def validation_error(e: ValidationError) -> list[dict]:
+    return e.errors(include_url=False, include_context=False, include_input=False)
+
+
+async def ndjson_users(lines: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line.strip():
+            yield line_number, line, UserImport.model_validate_json
+
+
+async def csv_users(lines: AsyncIterator[bytes]) -> AsyncIterator[tuple]:
+    # a header row naming the columns, username and password at least,
+    # then one user per line; empty cells take the default
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        cells = next(csv.reader([line.decode()]))
+        if header is None:
+            header = [cell.strip() for cell in cells]
+            continue
+        yield line_number, {
+            name: value for name, value in zip(header, cells) if value != ""
+        }, UserImport.model_validate
+
+
+IMPORT_FORMATS = {
+    "ndjson": ndjson_users,
+    "csv": csv_users,
+}
+
+
+DUPLICATE_USERNAME = "Username already exists."
+
+
+async def insert_users(batch: list[tuple[int, UserImport]]) -> list[dict]:
+    results = []
+    async with new_session() as session:
+        # one query for the whole batch instead of a SELECT per user
+        taken = set((await session.exec(
+            select(UserBase.username).
+                where(UserBase.username.in_([user.username for _, user in batch]))
+        )).all())
+    rows = []
+    for line, user in batch:
+        if user.username in taken:
+            results.append({"line": line, "error": DUPLICATE_USERNAME})
+            continue
+        taken.add(user.username)
+        rows.append((line, user))
+
+    # every core hashes, the event loop only waits for the batch, and no
+    # pooled connection is held meanwhile
+    loop = asyncio.get_running_loop()
+    hashes = await asyncio.gather(*(
+        loop.run_in_executor(provision_pool, hash_password, user.password.encode())
+        for _, user in rows
+    ))
+    values = [
+        UserBase(
+            password_hash=pw_hash,
+            **user.model_dump(exclude={"password"}),
+        ).model_dump()
+        for (_, user), pw_hash in zip(rows, hashes)
+    ]
+    if values:
+        # a username registered while the batch was hashing is skipped
+        # on its own instead of failing the whole transaction
+        statement = sqlite_insert(UserBase).on_conflict_do_nothing(
+            index_elements=[UserBase.username],
+        ).returning(UserBase.id)
+        try:
+            async with new_session() as session:
+                result = await session.exec(statement, params=values)
+                inserted = set(result.scalars())
+                await session.commit()
+        except Exception as e:
+            results += [{"line": line, "error": type(e).__name__} for line, _ in rows]
+            rows = []
+        for (line, _), row in zip(rows, values):
+            if row["id"] in inserted:
+                results.append({"line": line, "id": row["id"]})
+            else:
+                results.append({"line": line, "error": DUPLICATE_USERNAME})
+
+    return sorted(results, key=lambda result: result["line"])
+
+
+async def import_users(
+    lines: AsyncIterator[bytes],
+    format: str,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> AsyncIterator[dict]:
+    # One result per user line in input order within each batch, and a
+    # progress record after every batch with the totals so far.
+    start = time.perf_counter()
+    seen = created = 0
+    batch = []
+
+    async def flush():
+        nonlocal created
+        results = await insert_users(batch)
+        created += sum("id" in result for result in results)
+        batch.clear()
+        return results
+
+    def progress() -> dict:
+        elapsed = time.perf_counter() - start
+        return {"progress": {
+            "lines": seen,
+            "created": created,
+            "seconds": round(elapsed, 3),
+            "users_per_second": round(created / elapsed, 1) if elapsed else 0.0,
+        }}
+
+    try:
+        async for line, record, validate in IMPORT_FORMATS[format](lines):
+            seen = line
+            try:
+                batch.append((line, validate(record)))
+            except ValidationError as e:
+                yield {"line": line, "error": validation_error(e)}
+                continue
+            if len(batch) >= batch_size:
+                for result in await flush():
+                    yield result
+                yield progress()
+    except ndjson.LineTooLong as e:
+        yield {"line": seen + 1, "error": str(e)}
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield {"line": seen + 1, "error": type(e).__name__}
+
+    if batch:
+        for result in await flush():
+            yield result
+    yield progress()
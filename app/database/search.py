@@ -0,0 +1,91 @@
+import unicodedata
+
+from sqlalchemy import DDL, Connection, event, literal_column, table, column
+
+from app.database import Article
+
+
+# External content FTS5 index over article, rows are matched by rowid and
+# kept in sync by triggers. bm25 weights title over summary over content.
+# The index reads through a view, content may be stored compressed and
+# article_text() (app.database.compression) turns it back into text.
+SEARCH_TABLE = "article_search"
+SEARCH_SOURCE = "article_search_source"
+SEARCH_DDL = [
+    f"""CREATE VIEW IF NOT EXISTS {SEARCH_SOURCE} AS
+        SELECT rowid AS article_rowid, title, summary,
+            article_text(content) AS content
+        FROM article""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        title, summary, content,
+        content='{SEARCH_SOURCE}', content_rowid='article_rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank)
+        VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert
+        AFTER INSERT ON article BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, title, summary, content)
+            VALUES (new.rowid, new.title, new.summary, article_text(new.content));
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete
+        AFTER DELETE ON article BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, summary, content)
+            VALUES ('delete', old.rowid, old.title, old.summary, article_text(old.content));
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update
+        AFTER UPDATE OF title, summary, content ON article BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, summary, content)
+            VALUES ('delete', old.rowid, old.title, old.summary, article_text(old.content));
+            INSERT INTO {SEARCH_TABLE}(rowid, title, summary, content)
+            VALUES (new.rowid, new.title, new.summary, article_text(new.content));
+        END""",
+]
+SEARCH_DROP = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+    f"DROP VIEW IF EXISTS {SEARCH_SOURCE}",
+]
+
+for statement in SEARCH_DDL:
+    event.listen(Article.__table__, "after_create", DDL(statement))
+# the triggers go with the article table, the index and view have to be
+# dropped by hand
+for statement in SEARCH_DROP[3:]:
+    event.listen(Article.__table__, "before_drop", DDL(statement))
+
+
+def create_search_index(conn: Connection) -> None:
+    # for databases whose article table predates the index
+    for statement in SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+
+
+def rebuild_search_index(conn: Connection) -> None:
+    # recreated from scratch, older databases index the article table
+    # directly instead of the view
+    for statement in SEARCH_DROP:
+        conn.exec_driver_sql(statement)
+    create_search_index(conn)
+    conn.exec_driver_sql(
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"
+    )
+
+
+def match_expression(query: str) -> str:
+    # Every word is quoted, so user input is never parsed as FTS5 syntax.
+    # Control characters split words, a NUL would end the string early.
+    # Empty for blank input, which MATCH rejects, callers check for it.
+    query = "".join(
+        " " if unicodedata.category(char) == "Cc" else char for char in query
+    )
+    return " ".join(
+        '"' + word.replace('"', '""') + '"' for word in query.split()
+    )
+
+
+search_table = table(SEARCH_TABLE, column("rowid"), column("rank"))
+# the hidden column named after the table, MATCH and snippet() take it
+search_column = literal_column(SEARCH_TABLE)
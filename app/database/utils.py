@@ -1,3 +1,5 @@
+import hashlib
+import secrets
 import uuid
 from typing import Annotated
 from datetime import datetime, timezone,timedelta
@@ -6,78 +8,208 @@ import bcrypt
 import jwt
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import APIKeyHeader
-from sqlmodel import Session, select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import (
-    SECRET_KEY,
+    JWT_KEYS,
+    JWT_KEYS_FILE,
     TOKEN_ALGORITHM,
     TOKEN_EXPIRED_TIME,
-    engine,
+    REFRESH_TOKEN_EXPIRED_TIME,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    USER_CACHE_FILE,
+    USER_CACHE_SLOTS,
+    async_engine,
 )
-from app.database import UserBase, UserLogin, UserPermission
+from app.database import UserBase, RefreshToken, UserLogin, UserPermission
+from app.database.hashing import password_pool, hash_password, needs_rehash
+from app.database.cache import TTLCache, SharedGenerations
+from app.database.keys import KeyRing
+from app.metrics import crypto_timer
 
 
-def get_session():
-    with Session(engine) as session:
+def new_session() -> AsyncSession:
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+
+async def get_session():
+    async with new_session() as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
 
-def password_hasher(passwd: str) -> bytes:
-    salt = bcrypt.gensalt()
-    pw_hash = bcrypt.hashpw(passwd.encode(), salt)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+user_generations = SharedGenerations(USER_CACHE_FILE, USER_CACHE_SLOTS)
 
-    return pw_hash
 
+def cached_user(user_id: uuid.UUID) -> UserBase | None:
+    entry = user_cache.get(user_id)
+    if entry is None:
+        return None
 
-def auth_password(login: UserLogin) -> UserBase:
-    with Session(engine) as session:
-        try:
-            user = session.exec(
-                select(UserBase).where(UserBase.username==login.username,)
-            ).one()
+    generation, snapshot = entry
+    # changed by a write on any worker since it was cached
+    if generation != user_generations.get(user_id):
+        user_cache.pop(user_id)
+        return None
 
-            assert bcrypt.checkpw(login.password.encode(), user.password_hash)
+    # every caller gets its own instance, attached to no session but
+    # persistent, so handlers can still session.add() and mutate it
+    user = UserBase(**snapshot)
+    make_transient_to_detached(user)
+    return user
 
-            return user
-        except:
+
+def invalidate_user(user_id: uuid.UUID) -> None:
+    # called after the write is committed
+    user_cache.pop(user_id)
+    user_generations.bump(user_id)
+
+
+async def password_hasher(passwd: str) -> bytes:
+    with crypto_timer("bcrypt_hash"):
+        return await password_pool.run(hash_password, passwd.encode())
+
+
+async def check_password(passwd: str, pw_hash: bytes) -> bool:
+    with crypto_timer("bcrypt_check"):
+        return await password_pool.run(bcrypt.checkpw, passwd.encode(), pw_hash)
+
+
+async def auth_password(login: UserLogin) -> UserBase:
+    async with new_session() as session:
+        user = (await session.exec(
+            select(UserBase).where(UserBase.username==login.username,)
+        )).one_or_none()
+
+        if user is None or not await check_password(
+            login.password, user.password_hash,
+        ):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Invalid Username or Password.",
             )
 
+        if needs_rehash(user.password_hash):
+            user.password_hash = await password_hasher(login.password)
+            session.add(user)
+            await session.commit()
+            invalidate_user(user.id)
+
+        return user
+
 
 AuthDep = Annotated[UserBase, Depends(auth_password)]
 
 
+key_ring = KeyRing(JWT_KEYS_FILE, JWT_KEYS)
+
+
 def create_token(user: UserBase) -> str:
+    kid, key = key_ring.signing_key()
     try:
-        token = jwt.encode(
-            payload={
-                "user_id": str(user.id),
-                "username": user.username,
-                "exp": 
-                    datetime.now(timezone.utc) + 
-                    timedelta(minutes=TOKEN_EXPIRED_TIME), 
-            },
-            key=SECRET_KEY,
-            algorithm=TOKEN_ALGORITHM,
-        )
+        with crypto_timer("jwt_encode"):
+            token = jwt.encode(
+                payload={
+                    "user_id": str(user.id),
+                    "username": user.username,
+                    "exp":
+                        datetime.now(timezone.utc) +
+                        timedelta(minutes=TOKEN_EXPIRED_TIME),
+                },
+                key=key,
+                algorithm=TOKEN_ALGORITHM,
+                headers={"kid": kid},
+            )
         return token
     except jwt.PyJWKError:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,)
 
 
+def refresh_token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def create_refresh_token(session: AsyncSession, user_id: uuid.UUID) -> str:
+    token = secrets.token_urlsafe(32)
+    now = datetime.now()
+    # expired tokens of the user go on the way, through the user_id index
+    await session.exec(delete(RefreshToken).where(
+        RefreshToken.user_id == user_id, RefreshToken.expires < now,
+    ))
+    session.add(RefreshToken(
+        token_hash=refresh_token_hash(token),
+        user_id=user_id,
+        expires=now + timedelta(days=REFRESH_TOKEN_EXPIRED_TIME),
+    ))
+    await session.commit()
+    return token
+
+
+async def refresh_token(token: str) -> tuple[str, str]:
+    async with new_session() as session:
+        # deleting by primary key and reading the row back is one statement,
+        # so a token is spent exactly once even under concurrent refreshes
+        row = (await session.exec(
+            delete(RefreshToken)
+            .where(RefreshToken.token_hash == refresh_token_hash(token))
+            .returning(RefreshToken.user_id, RefreshToken.expires)
+        )).one_or_none()
+        user = None
+        if row is not None and row.expires >= datetime.now():
+            user = await load_user(row.user_id)
+        if user is None:
+            await session.commit()
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token.",
+            )
+        return create_token(user), await create_refresh_token(session, user.id)
+
+
+async def revoke_refresh_tokens(
+    session: AsyncSession, user_id: uuid.UUID | None = None,
+) -> None:
+    statement = delete(RefreshToken)
+    if user_id is not None:
+        statement = statement.where(RefreshToken.user_id == user_id)
+    await session.exec(statement)
+
+
+async def load_user(user_id: uuid.UUID) -> UserBase | None:
+    user = cached_user(user_id)
+    if user is None:
+        # read before the row, so a write committed in between leaves the
+        # entry under the old generation and it is never used
+        generation = user_generations.get(user_id)
+        async with new_session() as session:
+            user = (await session.exec(
+                select(UserBase).where(UserBase.id == user_id)
+            )).one_or_none()
+        if user is not None:
+            user_cache.set(user_id, (generation, user.model_dump()))
+    return user
+
+
 auth_header_scheme = APIKeyHeader(name="Authorization")
 
 
-def auth_token(token: Annotated[str, Security(auth_header_scheme)]) -> UserBase:
+async def auth_token(
+    token: Annotated[str, Security(auth_header_scheme)],
+) -> UserBase:
     try:
-        payload = jwt.decode(
-            token, SECRET_KEY, algorithms=[TOKEN_ALGORITHM],
-        )
+        key = key_ring.verification_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        with crypto_timer("jwt_decode"):
+            payload = jwt.decode(
+                token, key, algorithms=[TOKEN_ALGORITHM],
+            )
     except (
         jwt.InvalidTokenError,
         jwt.ExpiredSignatureError,
@@ -90,33 +222,27 @@ def auth_token(token: Annotated[str, Security(auth_header_scheme)]) -> UserBase:
     except jwt.PyJWKError as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    with Session(engine) as session:
-        user = session.exec(
-            select(UserBase).
-                where(UserBase.id == uuid.UUID(payload["user_id"])).
-                where(UserBase.username == payload["username"])
-        ).one()
-
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return user
+    user = await load_user(uuid.UUID(payload["user_id"]))
+    if user is None or user.username != payload["username"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
 
 TokenValidateDep = Annotated[UserBase, Security(auth_token)]
 
 
-def create_user(
+async def create_user(
     user_login: UserLogin,
     permission: UserPermission = UserPermission.guest,
     f_name: str | None = None,
     l_name: str | None = None,
 ) -> UserBase:
+    passwd_hash = await password_hasher(user_login.password)
     try:
-        passwd_hash = password_hasher(user_login.password)
         user = UserBase(
             username=user_login.username,
             password_hash=passwd_hash,
@@ -124,10 +250,10 @@ def create_user(
             f_name=f_name,
             l_name=l_name,
         )
-        with Session(engine) as session:
+        async with new_session() as session:
             session.add(user)
-            session.commit()
-            session.refresh(user)            
+            await session.commit()
+            await session.refresh(user)
 
             return user
     except:
@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import sys
+
+from app.database import EXPORT_FORMATS, export_articles
+
+
+async def write_export(output, format: str, compress: bool) -> int:
+    written = 0
+    async for chunk in export_articles(format, compress):
+        output.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Stream every published article to a file or stdout.",
+    )
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--output", help="file path, stdout when omitted")
+    args = parser.parse_args()
+
+    if args.output is None:
+        asyncio.run(write_export(sys.stdout.buffer, args.format, args.gzip))
+        return
+
+    with open(args.output, "wb") as output:
+        written = asyncio.run(write_export(output, args.format, args.gzip))
+    print(f"Wrote {written} bytes to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
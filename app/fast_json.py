@@ -0,0 +1,45 @@
+import json
+import uuid
+from datetime import date, datetime
+from enum import Enum
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    # the compact JSON of Pydantic's dump_json, orjson knows UUIDs, naive
+    # datetimes and enums natively and writes them the same way
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value, default=default, ensure_ascii=False, separators=(",", ":"),
+    ).encode()
+
+
+def encode_rows(rows, model: type[BaseModel]) -> bytes:
+    # Rows from our own queries already have the types of the model, they
+    # are encoded as they are instead of being validated into it first.
+    # Fields come out in model order, extra columns (cursors) are left out.
+    fields = tuple(model.model_fields)
+    return dumps([{name: getattr(row, name) for name in fields} for row in rows])
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
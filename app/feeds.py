@@ -0,0 +1,151 @@
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from app.config import FEED_SIZE, FEED_AUTHORS, FEED_TTL
+
+
+FeedEntry = namedtuple("FeedEntry", "id title author last_mod pub_date")
+
+
+class Feed:
+    # The first rows of a feed, newest first, scheduled ones included.
+    # complete means there are no more rows in the database.
+
+    def __init__(self, entries: list[FeedEntry], complete: bool, expires: float):
+        self.entries = entries
+        self.complete = complete
+        self.expires = expires
+
+
+class FeedCache:
+    # The first `size` articles of the front page (author None) and of the
+    # most recently read author pages, kept up to date by the writes of this
+    # process. They are read under a response cache list version, once that
+    # moves on without this process every feed is loaded again.
+
+    def __init__(self, size: int, max_authors: int, ttl: float) -> None:
+        self.size = size
+        self.max_authors = max_authors
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # bumped by every write, a load that raced one is thrown away
+        self.version = 0
+        # the response cache list version the feeds were read under
+        self.list_version: str | None = None
+        self._feeds: OrderedDict[str | None, Feed] = OrderedDict()
+        # the author feed an article is cached in, if any
+        self._authors: dict[uuid.UUID, str] = {}
+
+    def loaded(self, author: str | None, list_version: str) -> bool:
+        if list_version != self.list_version:
+            # another worker wrote through the shared response cache
+            self.clear()
+            self.list_version = list_version
+        feed = self._feeds.get(author)
+        if feed is not None and feed.expires < time.monotonic():
+            self._drop(author)
+            feed = None
+        return feed is not None
+
+    def load(self, author: str | None, rows, version: int) -> None:
+        if version != self.version:
+            return
+        entries = [FeedEntry(*row) for row in rows]
+        self._drop(author)
+        # unknown authors would only push real feeds out
+        if not entries:
+            return
+        self._feeds[author] = Feed(
+            entries, len(entries) < self.size, time.monotonic() + self.ttl,
+        )
+        if author is not None:
+            self._authors.update((entry.id, author) for entry in entries)
+            # the front page is never evicted
+            while len(self._feeds) > self.max_authors + 1:
+                self._drop(next(key for key in self._feeds if key is not None))
+
+    def page(
+        self,
+        author: str | None,
+        offset: int,
+        size: int,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> list[FeedEntry] | None:
+        # None when the page is not all in memory
+        feed = self._feeds.get(author)
+        if feed is None:
+            self.misses += 1
+            return None
+        if author is not None:
+            self._feeds.move_to_end(author)
+
+        now = datetime.now()
+        entries = [entry for entry in feed.entries if entry.pub_date <= now]
+        if after is not None:
+            entries = [
+                entry for entry in entries if (entry.last_mod, entry.id) < after
+            ]
+        if offset + size > len(entries) and not feed.complete:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entries[offset:offset + size]
+
+    def upsert(self, entry: FeedEntry) -> None:
+        self.remove(entry.id)
+        for key in (None, entry.author):
+            feed = self._feeds.get(key)
+            if feed is not None:
+                self._insert(key, feed, entry)
+
+    def remove(self, article_id: uuid.UUID) -> None:
+        self.version += 1
+        for key in (None, self._authors.pop(article_id, None)):
+            feed = self._feeds.get(key)
+            if feed is not None:
+                # the feed stays the first rows, just one fewer of them
+                feed.entries = [e for e in feed.entries if e.id != article_id]
+
+    def clear(self) -> None:
+        self.version += 1
+        self._feeds.clear()
+        self._authors.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _insert(self, key: str | None, feed: Feed, entry: FeedEntry) -> None:
+        sort_key = (entry.last_mod, entry.id)
+        position = next(
+            (
+                i for i, other in enumerate(feed.entries)
+                if (other.last_mod, other.id) < sort_key
+            ),
+            len(feed.entries),
+        )
+        # past the last cached row of an incomplete feed, where it belongs
+        # is not known, the database has it for the deep pages
+        if position == len(feed.entries) and not feed.complete:
+            return
+
+        feed.entries.insert(position, entry)
+        if key is not None:
+            self._authors[entry.id] = key
+        if len(feed.entries) > self.size:
+            dropped = feed.entries.pop()
+            feed.complete = False
+            if key is not None:
+                self._authors.pop(dropped.id, None)
+
+    def _drop(self, author: str | None) -> None:
+        feed = self._feeds.pop(author, None)
+        if feed is not None and author is not None:
+            for entry in feed.entries:
+                if self._authors.get(entry.id) == author:
+                    del self._authors[entry.id]
+
+
+feed_cache = FeedCache(FEED_SIZE, FEED_AUTHORS, FEED_TTL)
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import sys
+import time
+from collections.abc import AsyncIterator
+
+from sqlmodel import SQLModel
+
+from app.config import BULK_BATCH_SIZE, engine
+from app.database import IMPORT_FORMATS, import_users
+from app.fast_json import dumps
+
+
+async def file_lines(file) -> AsyncIterator[bytes]:
+    for line in file:
+        yield line.rstrip(b"\r\n")
+
+
+async def run_import(file, format: str, batch_size: int) -> tuple[int, int]:
+    # failed lines go to stdout as NDJSON, progress to stderr
+    created = failed = 0
+    async for result in import_users(file_lines(file), format, batch_size):
+        if "progress" in result:
+            progress = result["progress"]
+            print(
+                f"line {progress['lines']}: {progress['created']} created,"
+                f" {progress['users_per_second']} users/s",
+                file=sys.stderr,
+            )
+        elif "error" in result:
+            failed += 1
+            sys.stdout.buffer.write(dumps(result) + b"\n")
+        else:
+            created += 1
+    return created, failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Create users from a CSV (with a header row) or NDJSON file.",
+    )
+    parser.add_argument("path", help="input file, stdin when -")
+    parser.add_argument(
+        "--format", choices=list(IMPORT_FORMATS),
+        help="taken from the file extension when omitted",
+    )
+    parser.add_argument("--batch", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args()
+
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    SQLModel.metadata.create_all(engine)
+
+    start = time.perf_counter()
+    if args.path == "-":
+        created, failed = asyncio.run(
+            run_import(sys.stdin.buffer, format, args.batch)
+        )
+    else:
+        with open(args.path, "rb") as file:
+            created, failed = asyncio.run(run_import(file, format, args.batch))
+    print(
+        f"Created {created} users, {failed} failed,"
+        f" in {time.perf_counter() - start:.1f}s.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
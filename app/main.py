@@ -1,7 +1,10 @@
+import asyncio
 import contextlib
+import os
 
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
@@ -10,14 +13,58 @@ from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 
-from app.config import DEBUG, ORIGINS, limiter, engine
+from app.config import (
+    DEBUG,
+    FAST_JSON,
+    ORIGINS,
+    limiter,
+    engine,
+    async_engine,
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKERS,
+    SERVER_LOOP,
+    SERVER_HTTP,
+    SERVER_BACKLOG,
+    SERVER_KEEP_ALIVE,
+    SERVER_GRACEFUL_SHUTDOWN,
+    SERVER_MAX_REQUESTS,
+)
 from app.routers import articles, users
+from app.database import create_search_index, user_cache
+from app.database.explain import log_query_plans
+from app.fast_json import FastJSONResponse
+from app.metrics import MetricsMiddleware, registry, render_samples
+from app.profiling import ProfilingMiddleware
+from app.response_cache import response_cache
+from app.feeds import feed_cache
+from app.view_counter import view_counter
+
+
+# Set by run() once the schema is in place, so workers skip it
+DATABASE_READY_ENV = "APP_DATABASE_READY"
+
+
+def init_database(conn) -> None:
+    SQLModel.metadata.create_all(conn)
+    create_search_index(conn)
+    if DEBUG:
+        log_query_plans(conn)
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
-    SQLModel.metadata.create_all(engine)
+    if not os.environ.get(DATABASE_READY_ENV):
+        async with async_engine.begin() as conn:
+            await conn.run_sync(init_database)
+    flusher = asyncio.create_task(view_counter.run())
     yield
+    flusher.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await flusher
+    # counts still in memory are not lost on shutdown
+    await view_counter.flush()
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -26,6 +73,7 @@ app = FastAPI(
     redoc_url=None,
     debug=DEBUG,
     lifespan=lifespan,
+    default_response_class=FastJSONResponse if FAST_JSON else JSONResponse,
 )
 
 
@@ -41,15 +89,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(GZipMiddleware, minimum_size=800, compresslevel=5)
+app.add_middleware(ProfilingMiddleware)
+# outermost, so the time includes the other middlewares
+app.add_middleware(MetricsMiddleware)
+
+
+@registry.collector
+def cache_metrics() -> list[str]:
+    values = {}
+    for name, cache in (
+        ("response", response_cache), ("user", user_cache), ("feed", feed_cache),
+    ):
+        stats = cache.stats()
+        values[(name, "hit")] = stats["hits"]
+        values[(name, "miss")] = stats["misses"]
+    return render_samples(
+        "cache_lookups_total", "Cache lookups.", "counter",
+        ("cache", "result"), values,
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4",
+    )
 
 
 app.include_router(articles.router)
 app.include_router(users.router)
 
 
-if __name__ == "__main__":
+def run() -> None:
+    with engine.begin() as conn:
+        init_database(conn)
+    engine.dispose()
+    os.environ[DATABASE_READY_ENV] = "1"
+
     uvicorn.run(
-        app,
-        host="localhost",
-        port=8000,
-    )
\ No newline at end of file
+        "app.main:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        loop=SERVER_LOOP,
+        http=SERVER_HTTP,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN,
+        limit_max_requests=SERVER_MAX_REQUESTS or None,
+    )
@@ -0,0 +1,247 @@
+import contextlib
+import contextvars
+import threading
+import time
+from collections.abc import Callable
+
+from sqlalchemy import Engine, event
+
+
+# Seconds, the default buckets of the Prometheus clients
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_samples(
+    name: str,
+    help: str,
+    kind: str,
+    labels: tuple[str, ...],
+    values: dict[tuple[str, ...], float],
+) -> list[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for label_values, value in sorted(values.items()):
+        lines.append(f"{name}{format_labels(labels, label_values)} {value}")
+    return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return render_samples(self.name, self.help, "counter", self.labels, values)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # per label set: a count per bucket, then the sum and the total count
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        with self._lock:
+            for labels, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket"
+                        f"{format_labels(names, labels + (repr(float(bound)),))} {cumulative}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{format_labels(names, labels + ('+Inf',))} {counts[-1]}"
+                )
+                label_text = format_labels(self.labels, labels)
+                lines.append(f"{self.name}_sum{label_text} {counts[-2]}")
+                lines.append(f"{self.name}_count{label_text} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    # Metrics live in the process, every worker answers /metrics with its
+    # own numbers. Collectors are called at render time for values kept
+    # elsewhere, like the cache counters.
+
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Histogram] = []
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], list[str]]):
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.add(Histogram(
+    "http_request_duration_seconds",
+    "Time from the request to the last byte of the response.",
+    ("method", "route"),
+))
+request_status = registry.add(Counter(
+    "http_requests_total", "Responses sent.", ("method", "route", "status"),
+))
+request_queries = registry.add(Histogram(
+    "http_request_db_queries",
+    "SQL statements run while handling one request.",
+    ("method", "route"),
+    QUERY_COUNT_BUCKETS,
+))
+request_db_duration = registry.add(Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in SQL statements while handling one request.",
+    ("method", "route"),
+))
+query_duration = registry.add(Histogram(
+    "db_query_duration_seconds", "Time of one SQL statement.", ("statement",),
+))
+crypto_duration = registry.add(Histogram(
+    "crypto_duration_seconds",
+    "Time of password hashing and token signing calls.",
+    ("operation",),
+))
+
+
+class RequestStats:
+    # What the request being handled spent in the database. The profiler
+    # sets the lists to also get each statement and crypto call back.
+
+    __slots__ = ("queries", "seconds", "statements", "timings")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements: list[tuple[str, float]] | None = None
+        self.timings: list[tuple[str, float]] | None = None
+
+
+request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "request_stats", default=None,
+)
+
+
+@contextlib.contextmanager
+def crypto_timer(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        crypto_duration.observe(elapsed, operation)
+        stats = request_stats.get()
+        if stats is not None and stats.timings is not None:
+            stats.timings.append((operation, elapsed))
+
+
+def instrument_engine(engine: Engine) -> Engine:
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        query_duration.observe(elapsed, statement.lstrip().split(None, 1)[0].upper())
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+            if stats.statements is not None:
+                stats.statements.append((statement, elapsed))
+
+    return engine
+
+
+class MetricsMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestStats()
+        token = request_stats.set(stats)
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_stats.reset(token)
+            # the route template, raw paths would give a label per article
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            request_duration.observe(elapsed, method, route)
+            request_status.inc(method, route, str(status_code))
+            request_queries.observe(stats.queries, method, route)
+            request_db_duration.observe(stats.seconds, method, route)
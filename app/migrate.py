@@ -0,0 +1,137 @@
+import uuid
+
+from sqlalchemy import Connection, Engine, MetaData, inspect
+from sqlalchemy.schema import CreateTable
+from sqlmodel import SQLModel
+
+from app.config import engine, CONTENT_COMPRESSION
+from app.database import UserBase, rebuild_search_index
+from app.database.ids import UUIDBlob
+from app.database.compression import compress_content
+from app.database.search import SEARCH_TABLE, SEARCH_SOURCE
+
+
+def migrate_userbase_pk(conn: Connection) -> bool:
+    # userbase used to have a composite (id, username) primary key,
+    # SQLite can not alter a primary key so the table is rebuilt the way
+    # its documentation describes: a new table is filled and renamed over
+    # the old one. Renaming the old table away instead would rewrite the
+    # foreign keys of refreshtoken to point at it.
+    if not inspect(conn).has_table("userbase"):
+        return False
+    pk = inspect(conn).get_pk_constraint("userbase")["constrained_columns"]
+    if pk == ["id"]:
+        return False
+
+    table = UserBase.__table__
+    new_table = table.to_metadata(MetaData(), name="userbase_new")
+    columns = ", ".join(column.name for column in table.columns)
+    # index names are global in SQLite, they are created once the old
+    # table and its indexes are gone
+    conn.execute(CreateTable(new_table))
+    conn.exec_driver_sql(
+        f"INSERT INTO userbase_new ({columns}) SELECT {columns} FROM userbase"
+    )
+    conn.exec_driver_sql("DROP TABLE userbase")
+    conn.exec_driver_sql("ALTER TABLE userbase_new RENAME TO userbase")
+    for index in table.indexes:
+        index.create(conn)
+    return True
+
+
+def create_missing_indexes(conn: Connection) -> list[str]:
+    # create_all skips tables that already exist, indexes included
+    created = []
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            if not inspect(conn).has_index(table.name, index.name):
+                index.create(conn)
+                created.append(index.name)
+    return created
+
+
+def uuid_blob(value):
+    return uuid.UUID(value).bytes if isinstance(value, str) else value
+
+
+def migrate_uuid_blobs(conn: Connection) -> int:
+    # ids used to be stored as 32 hex characters, they are rewritten in place
+    # as 16 bytes. The values do not change, so URLs and tokens stay valid,
+    # only the new rows get time ordered version 7 ids.
+    conn.connection.driver_connection.create_function(
+        "uuid_blob", 1, uuid_blob, deterministic=True,
+    )
+    converted = 0
+    for table in SQLModel.metadata.sorted_tables:
+        for column in table.columns:
+            if isinstance(column.type, UUIDBlob):
+                converted += conn.exec_driver_sql(
+                    f"UPDATE {table.name} SET {column.name} = uuid_blob({column.name}) "
+                    f"WHERE typeof({column.name}) = 'text'"
+                ).rowcount
+    return converted
+
+
+def migrate_search_index(conn: Connection) -> bool:
+    # the index used to read article directly, it now reads through a view
+    # that decompresses content
+    sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE name = ?", (SEARCH_TABLE,),
+    ).scalar()
+    if sql is None or SEARCH_SOURCE in sql:
+        return False
+
+    rebuild_search_index(conn)
+    return True
+
+
+def compress_article_content(conn: Connection, method: str | None) -> int:
+    if method is None:
+        return 0
+
+    compressed = 0
+    last_rowid = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT rowid, content FROM article "
+            "WHERE rowid > ? AND typeof(content) = 'text' ORDER BY rowid LIMIT 500",
+            (last_rowid,),
+        ).all()
+        if not rows:
+            return compressed
+
+        conn.exec_driver_sql(
+            "UPDATE article SET content = ? WHERE rowid = ?",
+            [(compress_content(content, method), rowid) for rowid, content in rows],
+        )
+        compressed += len(rows)
+        last_rowid = rows[-1][0]
+
+
+def migrate(engine: Engine = engine) -> None:
+    with engine.begin() as conn:
+        if migrate_userbase_pk(conn):
+            print("Rebuilt userbase with a single column primary key.")
+        # only now, tables referencing userbase must see the rebuilt one
+        SQLModel.metadata.create_all(conn)
+        for name in create_missing_indexes(conn):
+            print(f"Created index {name}.")
+        converted = migrate_uuid_blobs(conn)
+        if converted:
+            print(f"Stored {converted} ids as 16 byte BLOBs.")
+        if migrate_search_index(conn):
+            print("Rebuilt the search index over decompressed content.")
+        compressed = compress_article_content(conn, CONTENT_COMPRESSION)
+        if compressed:
+            print(f"Compressed the content of {compressed} articles.")
+
+    if converted or compressed:
+        # rewritten rows leave half empty pages behind
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT",
+        ) as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,42 @@
+import json
+from collections.abc import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+MEDIA_TYPE = "application/x-ndjson"
+
+
+class LineTooLong(ValueError):
+    pass
+
+
+async def read_lines(
+    chunks: AsyncIterator[bytes], max_line: int,
+) -> AsyncIterator[bytes]:
+    # splits a streamed body into lines without holding more than one
+    # line (and one chunk) in memory
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > max_line:
+            raise LineTooLong(f"Lines are limited to {max_line} bytes.")
+    if buffer:
+        yield buffer
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=str).encode() + b"\n"
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    # For bodies that are produced while the request is still being read.
+    # StreamingResponse also listens on receive() for a disconnect, which
+    # would race the body iterator for the incoming chunks.
+    media_type = MEDIA_TYPE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
@@ -0,0 +1,129 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import DEBUG, PROFILE_HEADER, PROFILE_DIR, PROFILE_INTERVAL
+from app.database import UserPermission, auth_token
+from app.metrics import RequestStats, request_stats
+
+
+class StackSampler(threading.Thread):
+    # Samples the stack of one thread, the event loop, every interval and
+    # counts them in the folded format of flamegraph.pl and speedscope.
+    # Work of other requests served meanwhile lands in the same samples,
+    # and the thread pools (bcrypt, aiosqlite) are not sampled, their time
+    # shows up in the statement and crypto lists of the report instead.
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(
+                    f"{frame.f_globals.get('__name__')}:{frame.f_code.co_qualname}"
+                )
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def write_report(
+    path: str, scope: dict, elapsed: float, sampler: StackSampler, stats: RequestStats,
+) -> None:
+    with open(f"{path}.folded", "w") as file:
+        file.write(sampler.folded())
+
+    lines = [
+        f"{scope['method']} {scope['path']}",
+        f"total {elapsed * 1000:.3f} ms, {sum(sampler.stacks.values())} samples",
+        f"sql {sum(seconds for _, seconds in stats.statements) * 1000:.3f} ms"
+        f" in {len(stats.statements)} statements",
+        "",
+    ]
+    for statement, seconds in stats.statements:
+        lines.append(f"{seconds * 1000:10.3f} ms  {' '.join(statement.split())}")
+    lines.append("")
+    for operation, seconds in stats.timings:
+        lines.append(f"{seconds * 1000:10.3f} ms  {operation}")
+    with open(f"{path}.txt", "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+class ProfilingMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def allowed(self, headers: Headers) -> bool:
+        if DEBUG:
+            return True
+
+        token = headers.get("authorization")
+        if token is None:
+            return False
+        try:
+            user = await auth_token(token)
+        except HTTPException:
+            return False
+        return user.permission == UserPermission.admin
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if PROFILE_HEADER not in headers or not await self.allowed(headers):
+            await self.app(scope, receive, send)
+            return
+
+        report_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        # MetricsMiddleware has set one up already, unless it is not installed
+        stats = request_stats.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+        stats.statements = []
+        stats.timings = []
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(PROFILE_HEADER, report_id)
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            if token is not None:
+                request_stats.reset(token)
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            write_report(
+                os.path.join(PROFILE_DIR, report_id), scope, elapsed, sampler, stats,
+            )
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import Storage
+
+
+class SQLiteStorage(Storage):
+    # Rate limit counters in a SQLite file in WAL mode, shared by every
+    # worker on the host. A hit is one UPSERT that starts a new window when
+    # the old one expired and bumps the counter otherwise, so concurrent
+    # workers never lose an update. Expired windows are purged now and then.
+    #
+    #     Limiter(key_func=..., storage_uri="sqlite:///rate_limits.db")
+
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_INTERVAL = 60
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options) -> None:
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # sqlite:///relative.db or sqlite:////absolute.db, as in SQLAlchemy
+        self.path = uri.split("://", 1)[1].removeprefix("/")
+        self._local = threading.local()
+        self._purged = 0.0
+        self._connection().executescript(
+            """CREATE TABLE IF NOT EXISTS rate_limit (
+                key TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                expires REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_rate_limit_expires
+                ON rate_limit (expires);"""
+        )
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread, and none inherited over fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        connection = self._connection()
+        if now - self._purged > self.PURGE_INTERVAL:
+            self._purged = now
+            connection.execute("DELETE FROM rate_limit WHERE expires <= ?", (now,))
+
+        (count,) = connection.execute(
+            """INSERT INTO rate_limit (key, count, expires) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN expires <= ? THEN excluded.count
+                    ELSE count + excluded.count END,
+                expires = CASE WHEN expires <= ? THEN excluded.expires
+                    ELSE expires END
+            RETURNING count""",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT count FROM rate_limit WHERE key = ? AND expires > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires FROM rate_limit WHERE key = ? AND expires > ?",
+            (key, now),
+        ).fetchone()
+        return row[0] if row is not None else now
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        return self._connection().execute("DELETE FROM rate_limit").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM rate_limit WHERE key = ?", (key,))
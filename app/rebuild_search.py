@@ -0,0 +1,15 @@
+from sqlmodel import SQLModel
+
+from app.config import engine
+from app.database import rebuild_search_index
+
+
+def rebuild_search() -> None:
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        rebuild_search_index(conn)
+    print("Search index rebuilt.")
+
+
+if __name__ == "__main__":
+    rebuild_search()
@@ -0,0 +1,391 @@
+import gzip
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+from starlette.datastructures import Headers
+
+from app.config import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_DIR,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_GZIP,
+)
+
+
+# Bodies smaller than this are not worth compressing, same as GZipMiddleware
+GZIP_MINIMUM_SIZE = 800
+
+
+def key_group(key: str) -> str:
+    # "articles:list:<version>" or "articles:detail:<id>", the part of a key
+    # that is dropped all at once
+    return ":".join(key.split(":", 3)[:3])
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._remove(key)
+                return None
+
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.time() + ttl, value)
+            self.size += len(value)
+            while self.size > self.max_bytes and self._data:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def delete_group(self, group: str) -> None:
+        with self._lock:
+            for key in [key for key in self._data if key_group(key) == group]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _remove(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+
+class FileBackend:
+    # One file per key, shared by every worker on the host. Writes go
+    # through a temporary file and os.replace so readers never see half
+    # of an entry. File names start with a hash of the key group, so the
+    # pages of an old list version can be found and removed.
+
+    # Time by seconds, between two sweeps of expired files
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # this worker's count, other workers' writes show up on each sweep
+        self.size = 0
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self.sweep()
+
+    def _path(self, key: str) -> str:
+        group = hashlib.sha1(key_group(key).encode()).hexdigest()[:16]
+        return os.path.join(
+            self.directory, f"{group}-{hashlib.sha1(key.encode()).hexdigest()}",
+        )
+
+    def _file_size(self, path: str) -> int:
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _remove(self, path: str) -> None:
+        size = self._file_size(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self.size -= size
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        (expires,) = struct.unpack_from("!d", data)
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return data[8:]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        data = struct.pack("!d", time.time() + ttl) + value
+        with open(tmp, "wb") as file:
+            file.write(data)
+        replaced = self._file_size(path)
+        os.replace(tmp, path)
+        with self._lock:
+            self.size += len(data) - replaced
+            sweep = self.size > self.max_bytes or time.monotonic() >= self._next_sweep
+        if sweep:
+            self.sweep()
+
+    def delete(self, key: str) -> None:
+        self._remove(self._path(key))
+
+    def delete_group(self, group: str) -> None:
+        prefix = hashlib.sha1(group.encode()).hexdigest()[:16] + "-"
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix):
+                self._remove(entry.path)
+
+    def sweep(self) -> None:
+        # expired entries are removed, then the oldest ones until the
+        # directory fits in max_bytes, and the size is counted again
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            # temporary files of writes in progress
+            if "." in entry.name:
+                continue
+            try:
+                with open(entry.path, "rb") as file:
+                    (expires,) = struct.unpack("!d", file.read(8))
+                stat = entry.stat()
+            except (FileNotFoundError, struct.error):
+                continue
+            if expires < now:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self.size = total
+            self._next_sweep = time.monotonic() + self.SWEEP_INTERVAL
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.size = 0
+
+
+class ResponseCache:
+    # Entries hold the encoded body (gzipped when large enough) and the
+    # headers of the response. List pages are keyed under a version that
+    # every article write replaces, detail pages are deleted one by one.
+
+    LIST_VERSION_KEY = "articles:list:version"
+
+    def __init__(
+        self, backend: MemoryBackend | FileBackend | None, ttl: float, compress: bool,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+
+    def list_version(self) -> str:
+        if self.backend is None:
+            return ""
+
+        version = self.backend.get(self.LIST_VERSION_KEY)
+        if version is None:
+            return self.bump_list()
+        return version.decode()
+
+    @property
+    def shared(self) -> bool:
+        # other workers bump the list version too
+        return isinstance(self.backend, FileBackend)
+
+    def bump_list(self) -> str:
+        # the version list_version() returns from now on
+        if self.backend is None:
+            return ""
+
+        version = uuid.uuid4().hex
+        old_version = self.backend.get(self.LIST_VERSION_KEY)
+        # outlives any page stored under it
+        self.backend.set(
+            self.LIST_VERSION_KEY, version.encode(), self.ttl * 2,
+        )
+        # pages of the old version are never read again
+        if old_version is not None:
+            self.backend.delete_group(f"articles:list:{old_version.decode()}")
+        return version
+
+    def list_key(self, request: Request) -> str:
+        params = sorted(request.query_params.multi_items())
+        return f"articles:list:{self.list_version()}:{params}"
+
+    @staticmethod
+    def detail_key(article_id: uuid.UUID, title: str) -> str:
+        return f"articles:detail:{article_id.hex}:{title}"
+
+    def get(self, request: Request, key: str) -> Response | None:
+        if self.backend is None:
+            return None
+
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        (header_size,) = struct.unpack_from("!I", entry)
+        headers = json.loads(entry[4:4 + header_size])
+        return self._response(request, entry[4 + header_size:], headers)
+
+    def set(
+        self,
+        request: Request,
+        key: str,
+        body: bytes,
+        headers: dict[str, str] | None = None,
+        ttl: float | None = None,
+    ) -> Response:
+        headers = dict(headers or {})
+        if (
+            self.compress
+            and "Content-Encoding" not in headers
+            and len(body) >= GZIP_MINIMUM_SIZE
+        ):
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        if self.backend is not None:
+            encoded_headers = json.dumps(headers).encode()
+            self.backend.set(
+                key,
+                struct.pack("!I", len(encoded_headers)) + encoded_headers + body,
+                self.ttl if ttl is None else min(ttl, self.ttl),
+            )
+        return self._response(request, body, headers)
+
+    def delete(self, *keys: str) -> None:
+        if self.backend is not None:
+            for key in keys:
+                self.backend.delete(key)
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes": self.backend.size if self.backend is not None else 0,
+        }
+
+    @staticmethod
+    def _response(request: Request, body: bytes, headers: dict) -> Response:
+        headers = dict(headers)
+        if headers.get("Content-Encoding") == "gzip":
+            headers["Vary"] = "Accept-Encoding"
+            if "gzip" not in request.headers.get("accept-encoding", ""):
+                del headers["Content-Encoding"]
+                body = gzip.decompress(body)
+        return Response(
+            content=body, headers=headers, media_type="application/json",
+        )
+
+
+# Sent back with a 304 so caches can refresh what they already hold
+NOT_MODIFIED_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Vary")
+
+
+# ETags are weak, the same tag covers the gzip and the identity body
+def body_etag(body: bytes) -> str:
+    return f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+
+def article_etag(article_id: uuid.UUID, last_mod: datetime) -> str:
+    return f'W/"{article_id.hex}-{int(last_mod.timestamp() * 1_000_000)}"'
+
+
+def http_date(value: datetime) -> str:
+    # naive datetimes in the database are local time
+    return format_datetime(value.astimezone().replace(microsecond=0), usegmt=True)
+
+
+def not_modified(request: Request, headers: Headers) -> Response | None:
+    etag = headers.get("etag")
+    last_modified = headers.get("last-modified")
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        # weak comparison, as If-None-Match asks for
+        matched = etag is not None and (
+            "*" in tags or etag.removeprefix("W/") in tags
+        )
+    elif if_modified_since is not None and last_modified is not None:
+        try:
+            matched = (
+                parsedate_to_datetime(last_modified)
+                <= parsedate_to_datetime(if_modified_since)
+            )
+        except (TypeError, ValueError):
+            matched = False
+    else:
+        matched = False
+
+    if not matched:
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={
+            name: headers[name] for name in NOT_MODIFIED_HEADERS
+            if name in headers
+        },
+    )
+
+
+def create_backend(name: str | None) -> MemoryBackend | FileBackend | None:
+    if name == "memory":
+        return MemoryBackend(RESPONSE_CACHE_SIZE)
+    if name == "file":
+        return FileBackend(RESPONSE_CACHE_DIR, RESPONSE_CACHE_SIZE)
+    return None
+
+
+response_cache = ResponseCache(
+    create_backend(RESPONSE_CACHE_BACKEND),
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_GZIP,
+)
@@ -0,0 +1,48 @@
+import argparse
+import json
+import os
+import secrets
+
+from app.config import JWT_KEYS_FILE
+from app.database.keys import new_key_id, new_ring
+
+
+def rotate(path: str, keep: int) -> str:
+    try:
+        with open(path) as file:
+            ring = json.load(file)
+    except FileNotFoundError:
+        ring = new_ring()
+
+    kid = new_key_id()
+    ring["keys"][kid] = secrets.token_urlsafe(64)
+    ring["active"] = kid
+    # keys are kept in insertion order, the oldest go first
+    for old_kid in list(ring["keys"])[:-keep]:
+        del ring["keys"][old_kid]
+
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump(ring, file)
+    os.replace(tmp, path)
+    return kid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Add a new active JWT signing key to the key ring file.",
+    )
+    parser.add_argument("--path", default=JWT_KEYS_FILE)
+    parser.add_argument(
+        "--keep", type=int, default=2,
+        help="keys left in the ring, old ones verify until they are dropped",
+    )
+    args = parser.parse_args()
+
+    kid = rotate(args.path, max(args.keep, 1))
+    print(f"Signing with new key {kid}, workers pick it up on their own.")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,45 +7,304 @@ from fastapi import (
     Depends,
     Body,
     Path,
+    Query,
+    Request,
+    Response,
     HTTPException,
     status,
 )
-from sqlmodel import select
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_json
+from sqlalchemy import Text, type_coerce
+from sqlmodel import (
+    select, insert, update, delete, tuple_, func, or_, and_, literal_column,
+)
+from starlette.datastructures import Headers
 
-from app.config import PAGINATION
+from app import ndjson
+from app.fast_json import encode_rows
+from app.feeds import FeedEntry, feed_cache
+from app.view_counter import view_counter
+from app.config import (
+    FAST_JSON,
+    PAGINATION,
+    MAX_PAGINATION,
+    CACHE_CONTROL,
+    BULK_BATCH_SIZE,
+    BULK_MAX_LINE,
+)
+from app.response_cache import (
+    response_cache,
+    not_modified,
+    body_etag,
+    article_etag,
+    http_date,
+)
 from app.database import (
     SessionDep,
+    new_session,
+    encode_cursor,
+    decode_cursor,
+    next_link,
     Article,
+    ArticleView,
     ArticleList,
+    ArticleRead,
+    ArticleSearch,
     ArticleBase,
+    ArticlePatch,
     UserPermission,
     TokenValidateDep,
+    search_table,
+    search_column,
+    match_expression,
+    EXPORT_FORMATS,
+    export_articles,
 )
+from app.database.compression import gzip_around, content_json
 
 router = APIRouter(
     tags=["Articles"],
     prefix="/articles",
 )
 
+article_list_adapter = TypeAdapter(list[ArticleList])
+# Article fields in model order up to content
+ARTICLE_HEAD_FIELDS = ("id", "title", "pub_date", "last_mod", "author")
+
+
+class Pagination:
+    def __init__(
+        self,
+        page: Annotated[int, Query(ge=0)] = 0,
+        size: Annotated[int, Query(ge=1, le=MAX_PAGINATION)] = PAGINATION,
+        cursor: str | None = None,
+    ) -> None:
+        self.size = size
+        self.offset = 0
+        self.after = None
+        if cursor is not None:
+            last_mod, article_id = decode_cursor(cursor, 2)
+            try:
+                self.after = (
+                    datetime.fromisoformat(last_mod), uuid.UUID(article_id),
+                )
+                # last_mod is stored naive, an offset cannot be compared
+                if self.after[0].tzinfo is not None:
+                    raise ValueError(last_mod)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor.",
+                )
+        else:
+            # deprecated offset paging, kept for old clients
+            self.offset = page * size
+
+
+PaginationDep = Annotated[Pagination, Depends()]
+
+
+def articles_page(pagination: Pagination, author: str | None = None):
+    query = (
+        select(Article.author, Article.id, Article.title, Article.last_mod).
+            where(Article.pub_date <= datetime.now()).
+            order_by(Article.last_mod.desc(), Article.id.desc())
+    )
+    if author is not None:
+        query = query.where(Article.author == author)
+    if pagination.after is not None:
+        query = query.where(
+            tuple_(Article.last_mod, Article.id) < pagination.after
+        )
+    return query.offset(pagination.offset).limit(pagination.size)
+
+
+async def next_publication(session: SessionDep) -> float | None:
+    # seconds until the next scheduled article shows up in the list
+    now = datetime.now()
+    pub_date = (await session.exec(
+        select(func.min(Article.pub_date)).where(Article.pub_date > now)
+    )).one()
+    return None if pub_date is None else (pub_date - now).total_seconds()
 
-async def pagination(page: int) -> int:
-    return page * PAGINATION
+
+def feed_query(author: str | None):
+    # what a feed holds, scheduled articles included, they are filtered
+    # when pages are served
+    query = (
+        select(*(getattr(Article, name) for name in FeedEntry._fields)).
+            order_by(Article.last_mod.desc(), Article.id.desc()).
+            limit(feed_cache.size)
+    )
+    if author is not None:
+        query = query.where(Article.author == author)
+    return query
+
+
+async def feed_page(
+    session: SessionDep, pagination: Pagination, author: str | None,
+) -> list:
+    if not feed_cache.loaded(author, response_cache.list_version()):
+        version = feed_cache.version
+        feed_cache.load(
+            author, (await session.exec(feed_query(author))).all(), version,
+        )
+    articles = feed_cache.page(
+        author, pagination.offset, pagination.size, pagination.after,
+    )
+    if articles is None:
+        articles = (await session.exec(articles_page(pagination, author))).all()
+    return articles
+
+
+def invalidate_article(article_id: uuid.UUID, article_title: str) -> None:
+    response_cache.delete(response_cache.detail_key(article_id, article_title))
+    list_version = response_cache.bump_list()
+    # the feeds are patched by the caller, unless other workers may have
+    # written under the old version too, then they are read again
+    if not response_cache.shared:
+        feed_cache.list_version = list_version
 
 
 @router.get("/")
 async def articles_list(
-    session: SessionDep, page: Annotated[int, Depends(pagination)] = 0,
+    request: Request,
+    session: SessionDep,
+    pagination: PaginationDep,
+    author: str | None = None,
 ) -> list[ArticleList]:
-    articles = session.exec(
-        select(Article.author, Article.id, Article.title, Article.last_mod).
-            where(Article.pub_date <= datetime.now()).
-            order_by(Article.last_mod.desc()).
-            offset(page).limit(PAGINATION)
-    ).all()
+    cache_key = response_cache.list_key(request)
+    cached = response_cache.get(request, cache_key)
+    if cached is not None:
+        return not_modified(request, cached.headers) or cached
+
+    articles = await feed_page(session, pagination, author)
     if articles == []:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    return articles
+    headers = {"Cache-Control": CACHE_CONTROL["articles_list"]}
+    if len(articles) == pagination.size:
+        last = articles[-1]
+        cursor = encode_cursor(last.last_mod.isoformat(), last.id)
+        next_url = request.url.remove_query_params("page").include_query_params(
+            cursor=cursor, size=pagination.size,
+        )
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = next_link(next_url)
+
+    if FAST_JSON:
+        body = encode_rows(articles, ArticleList)
+    else:
+        body = article_list_adapter.dump_json(
+            article_list_adapter.validate_python(articles, from_attributes=True)
+        )
+    headers["ETag"] = body_etag(body)
+    response = response_cache.set(
+        request, cache_key, body, headers, ttl=await next_publication(session),
+    )
+    return not_modified(request, response.headers) or response
+
+
+def search_page(query: str, size: int, after: tuple[float, int] | None = None):
+    rank, rowid = search_table.c.rank, search_table.c.rowid
+    statement = (
+        select(
+            Article.id,
+            Article.title,
+            Article.author,
+            Article.last_mod,
+            func.snippet(search_column, -1, "<mark>", "</mark>", "…", 16).
+                label("snippet"),
+            rank,
+            rowid,
+        ).
+            select_from(search_table).
+            join(Article, literal_column("article.rowid") == rowid).
+            where(search_column.op("MATCH")(match_expression(query))).
+            where(Article.pub_date <= datetime.now()).
+            order_by(rank, rowid)
+    )
+    if after is not None:
+        statement = statement.where(or_(
+            rank > after[0], and_(rank == after[0], rowid > after[1]),
+        ))
+    return statement.limit(size)
+
+
+@router.get("/search")
+async def search_articles(
+    request: Request,
+    response: Response,
+    session: SessionDep,
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    size: Annotated[int, Query(ge=1, le=MAX_PAGINATION)] = PAGINATION,
+    cursor: str | None = None,
+) -> list[ArticleSearch]:
+    after = None
+    if cursor is not None:
+        rank, rowid = decode_cursor(cursor, 2)
+        try:
+            after = (float(rank), int(rowid))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor.",
+            )
+
+    if not match_expression(q):
+        return []
+
+    results = (await session.exec(search_page(q, size, after))).all()
+    headers = {}
+    if len(results) == size:
+        last = results[-1]
+        cursor = encode_cursor(repr(last.rank), last.rowid)
+        next_url = request.url.include_query_params(cursor=cursor)
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = next_link(next_url)
+
+    if FAST_JSON:
+        return Response(
+            encode_rows(results, ArticleSearch),
+            media_type="application/json",
+            headers=headers,
+        )
+    response.headers.update(headers)
+    return results
+
+
+def most_read_page(size: int):
+    # walks the views index from the top, counts waiting in memory are not
+    # in it until the next flush
+    return (
+        select(
+            Article.id, Article.title, Article.author, Article.last_mod,
+            ArticleView.views,
+        ).
+            join(Article, Article.id == ArticleView.article_id).
+            where(Article.pub_date <= datetime.now()).
+            order_by(ArticleView.views.desc()).
+            limit(size)
+    )
+
+
+@router.get("/most-read")
+async def most_read_articles(
+    session: SessionDep,
+    response: Response,
+    size: Annotated[int, Query(ge=1, le=MAX_PAGINATION)] = PAGINATION,
+) -> list[ArticleRead]:
+    results = (await session.exec(most_read_page(size))).all()
+    if FAST_JSON:
+        return Response(
+            encode_rows(results, ArticleRead),
+            media_type="application/json",
+            headers={"Cache-Control": CACHE_CONTROL["most_read_articles"]},
+        )
+    response.headers["Cache-Control"] = CACHE_CONTROL["most_read_articles"]
+    return results
 
 
 @router.post("/", status_code=status.HTTP_202_ACCEPTED)
@@ -60,26 +319,205 @@ async def create_article(
     article = Article(**content.model_dump())
     try:
         session.add(article)
-        session.commit()
+        await session.commit()
+        invalidate_article(article.id, article.title)
+        feed_cache.upsert(FeedEntry(
+            *(getattr(article, name) for name in FeedEntry._fields)
+        ))
 
         return content
     except:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT)
 
 
+async def insert_articles(batch: list[tuple[int, dict]]) -> list[dict]:
+    try:
+        async with new_session() as session:
+            await session.exec(
+                insert(Article), params=[row for _, row in batch],
+            )
+            await session.commit()
+    except Exception as e:
+        return [
+            {"line": line, "error": type(e).__name__} for line, _ in batch
+        ]
+
+    response_cache.bump_list()
+    # reloaded on the next read rather than patched row by row
+    feed_cache.clear()
+    return [{"line": line, "id": row["id"]} for line, row in batch]
+
+
+async def bulk_import(request: Request):
+    batch = []
+    line_number = 0
+    try:
+        async for line in ndjson.read_lines(request.stream(), BULK_MAX_LINE):
+            line_number += 1
+            if not line.strip():
+                continue
+
+            try:
+                content = ArticleBase.model_validate_json(line)
+            except ValidationError as e:
+                yield ndjson.dumps({"line": line_number, "error": e.errors(
+                    include_url=False, include_context=False, include_input=False,
+                )})
+                continue
+
+            batch.append((line_number, Article(**content.model_dump()).model_dump()))
+            if len(batch) >= BULK_BATCH_SIZE:
+                for result in await insert_articles(batch):
+                    yield ndjson.dumps(result)
+                batch = []
+    except ndjson.LineTooLong as e:
+        yield ndjson.dumps({"line": line_number + 1, "error": str(e)})
+
+    if batch:
+        for result in await insert_articles(batch):
+            yield ndjson.dumps(result)
+
+
+@router.post("/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_create_articles(
+    request: Request, user: TokenValidateDep,
+) -> ndjson.DuplexStreamingResponse:
+    if user.permission == UserPermission.guest:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    # one result line per input line, invalid lines are reported
+    # straight away, valid ones once their batch is committed
+    return ndjson.DuplexStreamingResponse(
+        bulk_import(request), status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+@router.get("/export")
+async def export_archive(
+    user: TokenValidateDep,
+    format: Annotated[str, Query(pattern="^(ndjson|csv)$")] = "ndjson",
+    compress: bool = False,
+) -> StreamingResponse:
+    if user.permission == UserPermission.guest:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    media_type = EXPORT_FORMATS[format][0]
+    headers = {"Content-Disposition": f'attachment; filename="articles.{format}"'}
+    if compress:
+        # already gzipped, GZipMiddleware leaves it alone
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_articles(format, compress), media_type=media_type, headers=headers,
+    )
+
+
 @router.get("/{article_title}/{article_id}")
 async def get_article(
-    session: SessionDep, article_title: str, article_id: uuid.UUID,
+    request: Request,
+    session: SessionDep,
+    article_title: str,
+    article_id: uuid.UUID,
 ) -> Article:
+    cache_key = response_cache.detail_key(article_id, article_title)
+    cached = response_cache.get(request, cache_key)
+    if cached is not None:
+        view_counter.add(article_id)
+        return not_modified(request, cached.headers) or cached
+
+    try:
+        # revalidation only needs last_mod, content is left on disk
+        last_mod = (await session.exec(
+            select(Article.last_mod).
+                where(Article.title == article_title).
+                where(Article.id == article_id)
+        )).one()
+    except:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # revalidated reads count too
+    view_counter.add(article_id)
+
+    headers = {
+        "ETag": article_etag(article_id, last_mod),
+        "Last-Modified": http_date(last_mod),
+        "Cache-Control": CACHE_CONTROL["get_article"],
+        # the body may be sent gzipped, the 304 below has to say so too
+        "Vary": "Accept-Encoding",
+    }
+    response = not_modified(request, Headers(headers=headers))
+    if response is not None:
+        return response
+
     try:
-        return session.exec(
-            select(Article).
+        # content comes back as stored, compressed rows are not inflated
+        row = (await session.exec(
+            select(
+                *(getattr(Article, name) for name in ARTICLE_HEAD_FIELDS),
+                type_coerce(Article.content, Text).label("content"),
+                Article.summary,
+            ).
                 where(Article.title == article_title).
                 where(Article.id == article_id)
-        ).one()
+        )).one()
     except:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+    # the same JSON as Article.model_dump_json(), built around the content
+    head = to_json({name: getattr(row, name) for name in ARTICLE_HEAD_FIELDS})
+    head = head[:-1] + b',"content":'
+    tail = b',"summary":' + to_json(row.summary) + b"}"
+    body = gzip_around(head, row.content, tail)
+    if body is not None:
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = head + content_json(row.content) + tail
+
+    return response_cache.set(request, cache_key, body, headers)
+
+
+async def update_article_columns(
+    session: SessionDep,
+    article_id: uuid.UUID,
+    article_title: str,
+    values: dict,
+    last_mod: datetime | None = None,
+) -> ArticleList:
+    # One UPDATE ... RETURNING with only the given columns, content is never
+    # read back. With last_mod it only matches the version the client read.
+    statement = (
+        update(Article).
+            where(Article.id == article_id).
+            where(Article.title == article_title).
+            values(**values).
+            returning(*(getattr(Article, name) for name in FeedEntry._fields))
+    )
+    if last_mod is not None:
+        statement = statement.where(Article.last_mod == last_mod)
+
+    try:
+        row = (await session.exec(statement)).one_or_none()
+        await session.commit()
+    except:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+
+    if row is None:
+        exists = (await session.exec(
+            select(Article.id).
+                where(Article.id == article_id).
+                where(Article.title == article_title)
+        )).one_or_none()
+        if exists is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Article was modified since last_mod.",
+        )
+
+    invalidate_article(article_id, article_title)
+    if row.title != article_title:
+        invalidate_article(article_id, row.title)
+    feed_cache.upsert(FeedEntry(*row))
+    return ArticleList.model_validate(row, from_attributes=True)
+
 
 @router.put(
     "/{article_title}/{article_id}",
@@ -95,25 +533,40 @@ async def update_article(
     if user.permission == UserPermission.guest:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    try:
-        article = session.exec(
-            select(Article).
-                where(Article.id == article_id).
-                where(Article.title == article_title)
-        ).one()
-    except:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # last_mod is the version behind the ETag, the server sets it
+    values = mod_article.model_dump()
+    values["last_mod"] = datetime.now()
+    await update_article_columns(session, article_id, article_title, values)
+    return mod_article.model_copy(update={"last_mod": values["last_mod"]})
 
-    for key, value in mod_article.model_dump().items():
-        setattr(article, key, value)
 
-    try:
-        session.delete(article)
-        session.commit()
-    except:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+@router.patch(
+    "/{article_title}/{article_id}",
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def patch_article(
+    session: SessionDep,
+    user: TokenValidateDep,
+    article_title: Annotated[str, Path()],
+    article_id: Annotated[uuid.UUID, Path()],
+    patch: Annotated[ArticlePatch, Body()],
+) -> ArticleList:
+    if user.permission == UserPermission.guest:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    # every article column is required, a null in the patch changes nothing
+    values = patch.model_dump(
+        exclude_unset=True, exclude_none=True, exclude={"last_mod"},
+    )
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to update.",
+        )
 
-    return mod_article
+    values["last_mod"] = datetime.now()
+    return await update_article_columns(
+        session, article_id, article_title, values, patch.last_mod,
+    )
 
 
 @router.delete(
@@ -130,16 +583,22 @@ async def delete_article(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
     try:
-        article = session.exec(
-            select(Article).
+        # content is not loaded, and so not inflated, just to be deleted
+        (await session.exec(
+            select(Article.id).
                 where(Article.id == article_id).
                 where(Article.title == article_title)
-        ).one()
+        )).one()
     except:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
     try:
-        session.delete(article)
-        session.commit()
+        await session.exec(
+            delete(ArticleView).where(ArticleView.article_id == article_id)
+        )
+        await session.exec(delete(Article).where(Article.id == article_id))
+        await session.commit()
     except:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+    invalidate_article(article_id, article_title)
+    feed_cache.remove(article_id)
@@ -1,20 +1,45 @@
-from fastapi import APIRouter, Request, HTTPException, status
-from sqlmodel import select
+import uuid
+from collections.abc import AsyncIterator
+from typing import Annotated
 
-from app.config import limiter
+from fastapi import APIRouter, Query, Request, Response, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlmodel import select, update
+
+from app import ndjson
+from app.config import (
+    FAST_JSON,
+    PAGINATION,
+    MAX_PAGINATION,
+    BULK_MAX_LINE,
+    limiter,
+)
+from app.fast_json import dumps, encode_rows
 from app.database import (
     SessionDep, 
+    new_session,
+    encode_cursor,
+    decode_cursor,
+    next_link,
     AuthDep,
     UserBase,
+    RefreshRequest,
     BasePassword,
     UserLogin,
     UserInfo,
+    UserInfoPatch,
     UserPermissionInfo,
     UserPermission,
     create_token,
+    create_refresh_token,
+    refresh_token,
+    revoke_refresh_tokens,
     TokenValidateDep,
     create_user,
+    import_users,
     password_hasher,
+    invalidate_user,
 )
 
 router = APIRouter(
@@ -22,11 +47,57 @@ router = APIRouter(
     prefix="/users",
 )
 
+users_permission_adapter = TypeAdapter(list[UserPermissionInfo])
+
+
+async def update_user_columns(
+    session: SessionDep, user_id: uuid.UUID, values: dict,
+) -> UserInfo:
+    # one UPDATE ... RETURNING, a taken username fails on the unique index
+    try:
+        row = (await session.exec(
+            update(UserBase).
+                where(UserBase.id == user_id).
+                values(**values).
+                returning(
+                    UserBase.id, UserBase.username, UserBase.f_name, UserBase.l_name,
+                )
+        )).one()
+        await session.commit()
+    except:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+
+    invalidate_user(user_id)
+    return UserInfo.model_validate(row, from_attributes=True)
+
 
 @router.post("/login")
 @limiter.limit("3/hour")
-async def login_user(request: Request, user: AuthDep):
-    return {"token": create_token(user)}
+async def login_user(request: Request, session: SessionDep, user: AuthDep):
+    return {
+        "token": create_token(user),
+        "refresh_token": await create_refresh_token(session, user.id),
+    }
+
+
+@router.post("/refresh")
+@limiter.limit("60/hour")
+async def refresh_user_token(request: Request, body: RefreshRequest):
+    token, new_refresh_token = await refresh_token(body.refresh_token)
+    return {"token": token, "refresh_token": new_refresh_token}
+
+
+@router.delete("/sessions", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_sessions(
+    session: SessionDep,
+    admin: TokenValidateDep,
+    user_id: uuid.UUID | None = None,
+) -> None:
+    if admin.permission != UserPermission.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    await revoke_refresh_tokens(session, user_id)
+    await session.commit()
 
 
 @router.post("/register", status_code=status.HTTP_204_NO_CONTENT)
@@ -34,15 +105,38 @@ async def login_user(request: Request, user: AuthDep):
 async def register_user(
     request: Request, session: SessionDep, user: UserLogin,
 ) -> None:
-    existing_user = session.exec(
+    existing_user = (await session.exec(
         select(UserBase).where(UserBase.username == user.username)
-    ).one_or_none()
+    )).one_or_none()
     if existing_user is not None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Username already exists.",
         )
-    create_user(user)
+    await create_user(user)
+
+
+async def import_results(request: Request, format: str) -> AsyncIterator[bytes]:
+    lines = ndjson.read_lines(request.stream(), BULK_MAX_LINE)
+    async for result in import_users(lines, format):
+        yield dumps(result) + b"\n"
+
+
+@router.post("/bulk", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_create_users(
+    request: Request,
+    admin: TokenValidateDep,
+    format: Annotated[str, Query(pattern="^(ndjson|csv)$")] = "ndjson",
+) -> ndjson.DuplexStreamingResponse:
+    if admin.permission != UserPermission.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    # no rate limit and no per user round trips: users are checked for
+    # duplicates, hashed and inserted a batch at a time, with one result
+    # line per user and a progress line after every batch
+    return ndjson.DuplexStreamingResponse(
+        import_results(request, format), status_code=status.HTTP_202_ACCEPTED,
+    )
 
 
 @router.put("/change-password", status_code=status.HTTP_204_NO_CONTENT)
@@ -53,27 +147,114 @@ async def change_password(
     user: TokenValidateDep,
     new_passwd: BasePassword,
 ) -> None:
+    passwd_hash = await password_hasher(new_passwd.password)
     try:
-        passwd_hash = password_hasher(new_passwd.password)
         user.password_hash = passwd_hash
 
         session.add(user)
-        session.commit()
+        await revoke_refresh_tokens(session, user.id)
+        await session.commit()
+        invalidate_user(user.id)
     except:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT)
 
 
+# rows pulled from the cursor at a time by the NDJSON stream
+USERS_CHUNK_ROWS = 500
+
+
+def prefix_range(prefix: str) -> tuple[str, str | None]:
+    # usernames starting with prefix are those in [prefix, upper), a range
+    # SQLite answers from the username index, which LIKE 'prefix%' cannot
+    # since LIKE ignores case and the index does not
+    for i in range(len(prefix) - 1, -1, -1):
+        if ord(prefix[i]) < 0x10FFFF:
+            return prefix, prefix[:i] + chr(ord(prefix[i]) + 1)
+    return prefix, None
+
+
+def users_query(
+    permission: UserPermission | None,
+    prefix: str | None,
+    after: str | None = None,
+):
+    # walks the username index in order, the permission is checked on the
+    # rows it visits
+    query = (
+        select(UserBase.id, UserBase.username, UserBase.permission).
+            order_by(UserBase.username)
+    )
+    if prefix:
+        low, high = prefix_range(prefix)
+        query = query.where(UserBase.username >= low)
+        if high is not None:
+            query = query.where(UserBase.username < high)
+    if after is not None:
+        query = query.where(UserBase.username > after)
+    if permission is not None:
+        query = query.where(UserBase.permission == permission)
+    return query
+
+
 @router.get("/permission")
 async def users_permission(
-    session: SessionDep, user: TokenValidateDep,
+    request: Request,
+    session: SessionDep,
+    user: TokenValidateDep,
+    permission: UserPermission | None = None,
+    prefix: Annotated[str | None, Query(max_length=32)] = None,
+    size: Annotated[int, Query(ge=1, le=MAX_PAGINATION)] = PAGINATION,
+    cursor: str | None = None,
 ) -> list[UserPermissionInfo]:
     if user.permission != UserPermission.admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    users = session.exec(
-        select(UserBase.id, UserBase.username, UserBase.permission)
-    ).all()
-    return users
+    after = None if cursor is None else decode_cursor(cursor, 1)[0]
+    users = (await session.exec(
+        users_query(permission, prefix, after).limit(size)
+    )).all()
+
+    headers = {}
+    if len(users) == size:
+        cursor = encode_cursor(users[-1].username)
+        next_url = request.url.include_query_params(cursor=cursor)
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = next_link(next_url)
+
+    if FAST_JSON:
+        body = encode_rows(users, UserPermissionInfo)
+    else:
+        body = users_permission_adapter.dump_json(
+            users_permission_adapter.validate_python(users, from_attributes=True)
+        )
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def users_ndjson(
+    permission: UserPermission | None, prefix: str | None,
+) -> AsyncIterator[bytes]:
+    async with new_session() as session:
+        result = await session.stream(
+            users_query(permission, prefix).
+                execution_options(yield_per=USERS_CHUNK_ROWS)
+        )
+        async for row in result:
+            yield dumps(row._asdict()) + b"\n"
+
+
+@router.get("/permission/stream")
+async def stream_users_permission(
+    user: TokenValidateDep,
+    permission: UserPermission | None = None,
+    prefix: Annotated[str | None, Query(max_length=32)] = None,
+) -> StreamingResponse:
+    if user.permission != UserPermission.admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+
+    # every matching user, one UserPermissionInfo per line, memory stays flat
+    return StreamingResponse(
+        users_ndjson(permission, prefix), media_type=ndjson.MEDIA_TYPE,
+    )
 
 
 @router.put("/permission", status_code=status.HTTP_202_ACCEPTED)
@@ -85,19 +266,19 @@ async def change_permission(
     if admin.permission != UserPermission.admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    try:
-        user = session.exec(
-            select(UserBase).where(UserBase.id == user_perm.id)
-        ).one()
-
-        user.permission = user_perm.permission
-        session.add(user)
-        session.commit()
-
-        return user_perm
-    except:
+    updated = (await session.exec(
+        update(UserBase).
+            where(UserBase.id == user_perm.id).
+            values(permission=user_perm.permission).
+            returning(UserBase.id)
+    )).one_or_none()
+    if updated is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
+    await session.commit()
+    invalidate_user(user_perm.id)
+    return user_perm
+
 
 @router.get("/info")
 @limiter.limit("20/hour")
@@ -118,19 +299,33 @@ async def update_user_info(
     if user.id != info.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
 
-    try:
-        for key, value in info.model_dump().items():
-            setattr(user, key, value)
+    await update_user_columns(session, user.id, info.model_dump(exclude={"id"}))
+    return info
 
-        session.add(user)
-        session.commit()
 
-        return info
-    except:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT)
+@router.patch("/info", status_code=status.HTTP_202_ACCEPTED)
+@limiter.limit("10/hour")
+async def patch_user_info(
+    request: Request,
+    session: SessionDep,
+    user: TokenValidateDep,
+    patch: UserInfoPatch,
+) -> UserInfo:
+    values = patch.model_dump(exclude_unset=True)
+    # names may be cleared, the username may not
+    if values.get("username", "") is None:
+        del values["username"]
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Nothing to update.",
+        )
+
+    return await update_user_columns(session, user.id, values)
 
 
 @router.delete("/info", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(session: SessionDep, user: TokenValidateDep) -> None:
-    session.delete(user)
-    session.commit()
\ No newline at end of file
+    await revoke_refresh_tokens(session, user.id)
+    await session.delete(user)
+    await session.commit()
+    invalidate_user(user.id)
\ No newline at end of file
@@ -0,0 +1,12 @@
+from sqlmodel import Session
+
+from ..utils import session_fixture, logger_fixture
+from app.database.explain import query_plans, is_full_scan
+
+
+def test_hot_queries_use_indexes(session: Session, logger):
+    plans = query_plans(session.connection())
+
+    for name, steps in plans.items():
+        assert not any(map(is_full_scan, steps)), f"{name}: {steps}"
+    logger.info("Test hot queries avoid full table scans.")
@@ -0,0 +1,22 @@
+from sqlmodel import Session, select
+
+from ..utils import session_fixture, logger_fixture
+from app.database import Article
+from app.database.ids import uuid7
+
+
+def test_uuid7_ids(session: Session, logger):
+    ids = [uuid7() for _ in range(1000)]
+    assert ids == sorted(ids)
+    assert all(value.version == 7 for value in ids)
+    logger.info("Test uuid7 ids are time ordered.")
+
+    article = Article(title="title", author="author", content="content", summary="summ")
+    session.add(article)
+    session.commit()
+    stored = session.connection().exec_driver_sql(
+        "SELECT typeof(id), length(id) FROM article"
+    ).one()
+    assert tuple(stored) == ("blob", 16)
+    assert session.exec(select(Article.id).where(Article.id == article.id)).one() == article.id
+    logger.info("Test ids are stored as 16 byte BLOBs.")
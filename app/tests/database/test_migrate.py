@@ -0,0 +1,161 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, create_engine, select
+
+from ..utils import logger_fixture
+from app import migrate as migrate_module
+from app.database import Article, ArticleView, RefreshToken, UserBase
+from app.database.compression import DEFLATE_TAG
+from app.migrate import migrate
+
+
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        # the tables as the first release created them, ids as hex text
+        conn.exec_driver_sql(
+            "CREATE TABLE article (id CHAR(32) NOT NULL, "
+            "title VARCHAR(64) NOT NULL, pub_date DATETIME NOT NULL, "
+            "last_mod DATETIME NOT NULL, author VARCHAR NOT NULL, content TEXT, "
+            "summary VARCHAR NOT NULL, PRIMARY KEY (id))"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE userbase (id CHAR(32) NOT NULL, f_name VARCHAR(32), "
+            "l_name VARCHAR(32), username VARCHAR(32) NOT NULL, "
+            "password_hash BLOB NOT NULL, permission VARCHAR(5) NOT NULL, "
+            "PRIMARY KEY (id, username))"
+        )
+    return engine
+
+
+def insert_article(conn, article_id: uuid.UUID, content: str) -> None:
+    now = datetime.now() - timedelta(days=1)
+    conn.exec_driver_sql(
+        "INSERT INTO article (id, title, pub_date, last_mod, author, content, "
+        "summary) VALUES (?, 'oldtitle', ?, ?, 'author', ?, 'summ')",
+        (article_id.hex, now, now, content),
+    )
+
+
+def test_migrate_baseline(logger, tmp_path):
+    engine = baseline_engine(tmp_path)
+    user_id = uuid.uuid4()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO userbase (id, username, password_hash, permission) "
+            "VALUES (?, 'olduser', x'00', 'admin')",
+            (user_id.hex,),
+        )
+
+    migrate(engine)
+
+    with engine.connect() as conn:
+        schema = conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE sql IS NOT NULL"
+        ).all()
+    assert not any("userbase_old" in sql or "userbase_new" in sql for _, sql in schema)
+    refreshtoken = dict(schema)["refreshtoken"]
+    assert 'REFERENCES userbase (id)' in refreshtoken
+    assert "ix_userbase_username" in dict(schema)
+    logger.info("Test userbase rebuild leaves foreign keys pointing at userbase.")
+
+    with Session(engine) as session:
+        user = session.exec(select(UserBase)).one()
+    assert (user.id, user.username) == (user_id, "olduser")
+    engine.dispose()
+    logger.info("Test migrated users keep their ids.")
+
+
+def test_migrate_uuid_blobs(logger, tmp_path):
+    engine = baseline_engine(tmp_path)
+    article_id, user_id = uuid.uuid4(), uuid.uuid4()
+    with engine.begin() as conn:
+        # refreshtoken as it was created before ids became BLOBs
+        conn.exec_driver_sql(
+            "CREATE TABLE refreshtoken (token_hash VARCHAR(64) NOT NULL, "
+            "user_id CHAR(32) NOT NULL, expires DATETIME NOT NULL, "
+            "PRIMARY KEY (token_hash), FOREIGN KEY(user_id) REFERENCES userbase (id))"
+        )
+        insert_article(conn, article_id, "content")
+        conn.exec_driver_sql(
+            "INSERT INTO userbase (id, username, password_hash, permission) "
+            "VALUES (?, 'olduser', x'00', 'admin')",
+            (user_id.hex,),
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO refreshtoken (token_hash, user_id, expires) "
+            "VALUES ('hash', ?, ?)",
+            (user_id.hex, datetime.now()),
+        )
+
+    migrate(engine)
+
+    with engine.connect() as conn:
+        types = conn.exec_driver_sql(
+            "SELECT (SELECT typeof(id) || length(id) FROM article), "
+            "(SELECT typeof(id) || length(id) FROM userbase), "
+            "(SELECT typeof(user_id) || length(user_id) FROM refreshtoken)"
+        ).one()
+    assert tuple(types) == ("blob16", "blob16", "blob16")
+    logger.info("Test ids of every table are stored as 16 byte BLOBs.")
+
+    with Session(engine) as session:
+        article = session.get(Article, article_id)
+        assert (article.id, article.title) == (article_id, "oldtitle")
+        assert session.get(UserBase, user_id).username == "olduser"
+        logger.info("Test migrated ids round-trip.")
+
+        token = session.exec(
+            select(RefreshToken.token_hash, UserBase.id).
+                join(UserBase, UserBase.id == RefreshToken.user_id)
+        ).one()
+        assert tuple(token) == ("hash", user_id)
+        session.add(ArticleView(article_id=article_id, views=3))
+        session.commit()
+        view = session.exec(
+            select(Article.title, ArticleView.views).
+                join(Article, Article.id == ArticleView.article_id)
+        ).one()
+        assert tuple(view) == ("oldtitle", 3)
+    engine.dispose()
+    logger.info("Test foreign keys still join after the conversion.")
+
+
+def test_migrate_compressed_content(logger, tmp_path, monkeypatch):
+    monkeypatch.setattr(migrate_module, "CONTENT_COMPRESSION", "zlib")
+    engine = baseline_engine(tmp_path)
+    content = "Old \"quoted\" text, ünïcode and a fox.\n" * 100
+    article_ids = [uuid.uuid4() for _ in range(3)]
+    with engine.begin() as conn:
+        for article_id in article_ids:
+            insert_article(conn, article_id, content + article_id.hex)
+
+    migrate(engine)
+
+    with engine.connect() as conn:
+        stored = conn.exec_driver_sql(
+            "SELECT content FROM article ORDER BY id"
+        ).scalars().all()
+        texts = conn.exec_driver_sql(
+            "SELECT article_text(content) FROM article ORDER BY id"
+        ).scalars().all()
+    assert all(value[:1] == DEFLATE_TAG for value in stored)
+    assert all(len(value) < len(content) for value in stored)
+    # BLOB ids sort by their bytes
+    article_ids.sort(key=lambda article_id: article_id.bytes)
+    assert texts == [content + article_id.hex for article_id in article_ids]
+    logger.info("Test migrate compresses existing content.")
+
+    with Session(engine) as session:
+        for article_id in article_ids:
+            assert session.get(Article, article_id).content == content + article_id.hex
+    logger.info("Test compressed content reads back as text.")
+
+    migrate(engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql(
+            "SELECT content FROM article ORDER BY id"
+        ).scalars().all() == stored
+    engine.dispose()
+    logger.info("Test a second migrate leaves compressed rows alone.")
@@ -1,19 +1,33 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import time
 import uuid
+from datetime import datetime, timedelta
 
 from fastapi import status
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from ..utils import session_fixture, client_fixture, logger_fixture
-from app.config import PAGINATION
+from app.config import PAGINATION, MAX_PAGINATION
+from app.response_cache import response_cache, FileBackend
+from app.database.compression import CompressedText, gzip_around
+from app.routers import articles
+from app.view_counter import view_counter
+from app.feeds import feed_cache
 from app.database import (
     Article,
+    ArticleView,
     ArticleList,
     ArticleBase,
     UserLogin,
     UserPermission,
     create_user,
     create_token,
+    encode_cursor,
 )
 
 base_url = "/articles"
@@ -43,11 +57,267 @@ def test_articles_list(session: Session, client: TestClient, logger):
     logger.info("Test ArticleList model.")
 
 
+def test_articles_list_cursor(session: Session, client: TestClient, logger):
+    for i in range(20):
+        session.add(
+            Article(
+                title=f"title{i}", author=f"author{i}", content=f"content{i}", summary=f"summ{i}"
+            )
+        )
+    session.commit()
+
+    seen = []
+    params = {"size": 7}
+    while True:
+        response = client.get(base_url + "/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        seen += [article["id"] for article in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"size": 7, "cursor": response.headers["X-Next-Cursor"]}
+    assert len(seen) == len(set(seen)) == 20
+    logger.info("Test cursor pagination walks every article once.")
+
+    response = client.get(
+        base_url + "/", params={"size": 7}, headers={"Host": "evil.example"},
+    )
+    response = client.get(base_url + "/", params={"size": 7})
+    assert response.headers["Link"].startswith("</articles/?")
+    assert "evil.example" not in response.headers["Link"]
+    logger.info("Test cached Link header is relative.")
+
+    response = client.get(base_url + "/", params={"size": MAX_PAGINATION + 1})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.get(base_url + "/", params={"cursor": "invalid"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    cursor = encode_cursor("2020-01-01T00:00:00+05:00", uuid.uuid4())
+    response = client.get(base_url + "/", params={"cursor": cursor})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    logger.info("Test page size cap and invalid cursor.")
+
+
+def test_articles_list_cache(session: Session, client: TestClient, logger):
+    session.add(
+        Article(title="title", author="author", content="content", summary="summ")
+    )
+    session.add(
+        Article(
+            title="scheduled", author="author", content="content", summary="summ",
+            pub_date=datetime.now() + timedelta(seconds=1),
+        )
+    )
+    session.commit()
+
+    response = client.get(base_url + "/")
+    assert len(response.json()) == 1
+    hits = response_cache.hits
+    response = client.get(base_url + "/")
+    assert response_cache.hits == hits + 1
+    logger.info("Test cached articles_list.")
+
+    temp = temp_article_base_user()
+    client.post(
+        base_url + "/",
+        headers=temp["headers"],
+        content=temp["article"].model_dump_json()
+    )
+    response = client.get(base_url + "/")
+    assert len(response.json()) == 2
+    logger.info("Test create_article invalidates articles_list.")
+
+    time.sleep(1)
+    response = client.get(base_url + "/")
+    assert len(response.json()) == 3
+    logger.info("Test scheduled article is not cached away.")
+
+
+def test_file_response_cache(
+    session: Session, client: TestClient, logger, monkeypatch, tmp_path,
+):
+    backend = FileBackend(str(tmp_path), 4000)
+    monkeypatch.setattr(response_cache, "backend", backend)
+    session.add(
+        Article(title="title", author="author", content="content", summary="summ")
+    )
+    session.commit()
+
+    for size in range(1, 4):
+        client.get(base_url + "/", params={"size": size})
+    hits = response_cache.hits
+    client.get(base_url + "/", params={"size": 1})
+    assert response_cache.hits == hits + 1
+    # three pages and the list version
+    assert len(list(tmp_path.iterdir())) == 4
+    response_cache.bump_list()
+    assert len(list(tmp_path.iterdir())) == 1
+    logger.info("Test bump_list removes the pages of the old version.")
+
+    for i in range(20):
+        backend.set(f"test:key:{i}", b"x" * 500, 60)
+    backend.set("test:expired:0", b"x", -1)
+    backend.sweep()
+    files = list(tmp_path.iterdir())
+    assert backend.size == sum(path.stat().st_size for path in files) <= 4000
+    assert backend.get("test:expired:0") is None
+    logger.info("Test file backend stays within its size.")
+
+
+def test_articles_list_fast_json(
+    session: Session, client: TestClient, logger, monkeypatch,
+):
+    for i in range(3):
+        session.add(
+            Article(
+                title=f"títle{i}", author=f"author{i}", content=f"content{i}", summary=f"summ{i}"
+            )
+        )
+    session.commit()
+
+    response = client.get(base_url + "/")
+    response_cache.clear()
+    monkeypatch.setattr(articles, "FAST_JSON", True)
+    fast_response = client.get(base_url + "/")
+    assert fast_response.status_code == status.HTTP_200_OK
+    assert fast_response.content == response.content
+    logger.info("Test rows encoded directly match the validated body.")
+
+    response = client.get(base_url + "/search", params={"q": "content1"})
+    assert response.headers["content-type"] == "application/json"
+    assert [result["title"] for result in response.json()] == ["títle1"]
+    assert set(response.json()[0]) == {"id", "title", "author", "last_mod", "snippet"}
+    logger.info("Test search rows encoded directly.")
+
+
+def test_articles_list_feeds(
+    session: Session, client: TestClient, logger, monkeypatch,
+):
+    monkeypatch.setattr(feed_cache, "size", 3)
+    now = datetime.now()
+    for i in range(5):
+        session.add(
+            Article(
+                title=f"title{i}", author=f"author{i % 2}", content="content",
+                summary="summ", last_mod=now - timedelta(minutes=10 - i),
+            )
+        )
+    session.commit()
+
+    def titles(**params) -> list[str]:
+        response = client.get(base_url + "/", params=params)
+        return [article["title"] for article in response.json()]
+
+    def walk(author: str) -> list[str]:
+        seen = []
+        params = {"author": author, "size": 2}
+        while True:
+            response = client.get(base_url + "/", params=params)
+            if response.status_code == status.HTTP_404_NOT_FOUND:
+                return seen
+            seen += [article["title"] for article in response.json()]
+            if "X-Next-Cursor" not in response.headers:
+                return seen
+            params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert walk("author0") == ["title4", "title2", "title0"]
+    assert walk("author1") == ["title3", "title1"]
+    assert titles(page=1, size=3) == ["title1", "title0"]
+    logger.info("Test author feeds and deep pages past the cached rows.")
+
+    temp = temp_article_base_user()
+    article = temp["article"]
+    article.author = "author0"
+    client.post(base_url + "/", headers=temp["headers"], content=article.model_dump_json())
+    hits = feed_cache.hits
+    assert titles(author="author0", size=2) == ["titlebase", "title4"]
+    assert titles(size=2) == ["titlebase", "title4"]
+    assert feed_cache.hits == hits + 2
+    logger.info("Test create_article updates the cached feeds.")
+
+    created = session.exec(select(Article).where(Article.title == "titlebase")).one()
+    client.patch(
+        base_url + f"/titlebase/{created.id}",
+        content=json.dumps({
+            "author": "author1", "last_mod": created.last_mod.isoformat(),
+        }),
+        headers=temp["headers"],
+    )
+    assert titles(author="author0", size=2) == ["title4", "title2"]
+    assert titles(author="author1", size=2) == ["titlebase", "title3"]
+    logger.info("Test patch_article moves the article between author feeds.")
+
+    client.delete(base_url + f"/titlebase/{created.id}", headers=temp["headers"])
+    assert titles(author="author1", size=2) == ["title3", "title1"]
+    assert titles(size=2) == ["title4", "title3"]
+    logger.info("Test delete_article removes the article from the feeds.")
+
+    # a write of another worker, seen through the shared list version
+    session.add(
+        Article(
+            title="titleother", author="author0", content="content",
+            summary="summ",
+        )
+    )
+    session.commit()
+    assert titles(size=2) == ["title4", "title3"]
+    response_cache.bump_list()
+    assert titles(size=2) == ["titleother", "title4"]
+    assert titles(author="author0", size=2) == ["titleother", "title4"]
+    logger.info("Test a new list version reloads the feeds.")
+
+
+def test_search_articles(session: Session, client: TestClient, logger):
+    for i in range(12):
+        session.add(
+            Article(
+                title=f"title{i}", author="author", summary=f"summ{i}",
+                content=f"the quick brown fox number{i} jumps",
+            )
+        )
+    session.add(
+        Article(
+            title="fox", author="author", summary="summ", content="nothing",
+        )
+    )
+    session.commit()
+
+    response = client.get(base_url + "/search", params={"q": "fox"})
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert len(results) == PAGINATION
+    assert results[0]["title"] == "fox"
+    assert "<mark>fox</mark>" in results[1]["snippet"]
+    logger.info("Test search ranks title matches first with snippets.")
+
+    response = client.get(
+        base_url + "/search",
+        params={"q": "fox", "cursor": response.headers["X-Next-Cursor"]},
+    )
+    ids = {result["id"] for result in results}
+    assert len(response.json()) == 3
+    assert ids.isdisjoint(result["id"] for result in response.json())
+    logger.info("Test search keyset pagination.")
+
+    response = client.get(base_url + "/search", params={"q": 'number3 "OR'})
+    assert response.json() == []
+    response = client.get(base_url + "/search", params={"q": "number3"})
+    assert [result["title"] for result in response.json()] == ["title3"]
+    logger.info("Test search input is not parsed as FTS syntax.")
+
+    response = client.get(base_url + "/search", params={"q": " \t"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+    response = client.get(base_url + "/search", params={"q": "number3\x00"})
+    assert [result["title"] for result in response.json()] == ["title3"]
+    response = client.get(base_url + "/search", params={"q": "\x00"})
+    assert response.json() == []
+    logger.info("Test blank and control character search input.")
+
+
 def temp_article_base_user():
-    user = create_user(
+    user = asyncio.run(create_user(
         UserLogin(username="tempuser", password="temppasswd"),
         UserPermission.staff
-    )
+    ))
     token = create_token(user)
     article = ArticleBase(
         title="titlebase",
@@ -77,6 +347,49 @@ def test_create_article(session: Session, client: TestClient, logger):
     logger.info("Test create_article.")
 
 
+def test_bulk_create_articles(session: Session, client: TestClient, logger):
+    temp = temp_article_base_user()
+    lines = [temp["article"].model_dump_json() for _ in range(3)]
+    lines.insert(1, '{"title": "missing fields"}')
+
+    response = client.post(
+        base_url + "/bulk",
+        headers=temp["headers"],
+        content=("\n".join(lines) + "\n").encode(),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["line"] for result in results) == [1, 2, 3, 4]
+    assert [result["line"] for result in results if "error" in result] == [2]
+    assert len(session.exec(select(Article)).all()) == 3
+    logger.info("Test bulk_create_articles.")
+
+
+def test_export_archive(session: Session, client: TestClient, logger):
+    for i in range(3):
+        session.add(
+            Article(title=f"title{i}", author="auth", content=f"content{i}", summary="sum")
+        )
+    session.commit()
+    temp = temp_article_base_user()
+
+    response = client.get(base_url + "/export", headers=temp["headers"])
+    assert response.status_code == status.HTTP_200_OK
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row["content"] for row in rows) == ["content0", "content1", "content2"]
+    logger.info("Test export_archive ndjson.")
+
+    response = client.get(
+        base_url + "/export",
+        headers=temp["headers"],
+        params={"format": "csv", "compress": True},
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3 and rows[0]["title"].startswith("title")
+    logger.info("Test export_archive gzipped csv.")
+
+
 def test_get_article(session: Session, client: TestClient, logger):
     article = Article(
         title="title",
@@ -98,6 +411,72 @@ def test_get_article(session: Session, client: TestClient, logger):
     logger.info("Test get_article, 404 status error.")
 
 
+def test_get_article_conditional(session: Session, client: TestClient, logger):
+    article = temp_create_article(session)
+    url = base_url + f"/{article.title}/{article.id}"
+
+    response = client.get(url)
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    assert "Cache-Control" in response.headers
+
+    assert etag.startswith("W/")
+    response_cache.clear()
+    for headers in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        response = client.get(url, headers=headers)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["Vary"] == "Accept-Encoding"
+    logger.info("Test get_article 304 without cached response.")
+
+    response = client.get(url)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = client.get(url, headers={"If-None-Match": '"stale"'})
+    assert response.status_code == status.HTTP_200_OK
+    logger.info("Test get_article 304 from cached response.")
+
+    response = client.get(base_url + "/")
+    response = client.get(
+        base_url + "/", headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    logger.info("Test articles_list 304.")
+
+
+def test_get_article_compressed(session: Session, client: TestClient, logger):
+    content = "Long \"quoted\" text, ünïcode and a fox.\n" * 200
+    article = Article(title="packed", author="auth", content="", summary="sum")
+    session.add(article)
+    session.commit()
+    stored = CompressedText("zlib").process_bind_param(content, None)
+    session.connection().exec_driver_sql(
+        "UPDATE article SET content = ?", (stored,),
+    )
+    session.commit()
+    session.refresh(article)
+    assert article.content == content
+    assert len(stored) < len(content)
+    logger.info("Test compressed content reads back as text.")
+
+    url = base_url + f"/{article.title}/{article.id}"
+    response = client.get(url)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.json() == json.loads(article.model_dump_json())
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json()["content"] == content
+    logger.info("Test get_article serves the stored deflate data.")
+
+    # gzip checks the trailer built from the stored CRC32 and length
+    assert json.loads(gzip.decompress(gzip_around(b"[", stored, b"]"))) == [content]
+    logger.info("Test gzip_around trailer.")
+
+    response = client.get(base_url + "/search", params={"q": "fox"})
+    assert response.json()[0]["title"] == "packed"
+    logger.info("Test search indexes compressed content.")
+
+
 def temp_create_article(session: Session):
     article = Article(
         title="titletest",
@@ -112,6 +491,44 @@ def temp_create_article(session: Session):
     return article
 
 
+def test_most_read_articles(session: Session, client: TestClient, logger):
+    titles = []
+    for i in range(3):
+        article = Article(
+            title=f"title{i}", author="author", content="content", summary="summ",
+        )
+        session.add(article)
+        titles.append((article.title, article.id))
+    session.commit()
+
+    for title, article_id in titles[:2]:
+        for _ in range(2 if title == "title0" else 1):
+            response = client.get(f"{base_url}/{title}/{article_id}")
+            assert response.status_code == status.HTTP_200_OK
+    assert sum(view_counter.counts.values()) == 3
+    assert asyncio.run(view_counter.flush()) == 2
+    assert view_counter.counts == {}
+    logger.info("Test reads are counted in memory and flushed in one batch.")
+
+    for _ in range(2):
+        client.get(f"{base_url}/{titles[1][0]}/{titles[1][1]}")
+    asyncio.run(view_counter.flush())
+    response = client.get(base_url + "/most-read")
+    assert response.status_code == status.HTTP_200_OK
+    assert [(article["title"], article["views"]) for article in response.json()] == [
+        ("title1", 3), ("title0", 2),
+    ]
+    logger.info("Test flushes add up and most_read_articles orders by views.")
+
+    temp = temp_article_base_user()
+    client.delete(f"{base_url}/{titles[1][0]}/{titles[1][1]}", headers=temp["headers"])
+    assert session.exec(select(ArticleView)).all()[0].article_id == titles[0][1]
+    view_counter.add(titles[1][1])
+    asyncio.run(view_counter.flush())
+    assert len(session.exec(select(ArticleView)).all()) == 1
+    logger.info("Test delete_article drops its views, later flushes too.")
+
+
 def test_update_article(session: Session, client: TestClient, logger):
     article = temp_create_article(session)
     temp = temp_article_base_user()
@@ -123,9 +540,48 @@ def test_update_article(session: Session, client: TestClient, logger):
     )
     assert response.status_code == status.HTTP_202_ACCEPTED
     assert response.json()["title"] == temp["article"].model_dump()["title"]
+    session.expire_all()
+    updated = session.get(Article, article.id)
+    assert updated is not None and updated.content == temp["article"].content
+    assert updated.last_mod > temp["article"].last_mod
     logger.info("Test update_article.")
 
 
+def test_patch_article(session: Session, client: TestClient, logger):
+    article = temp_create_article(session)
+    temp = temp_article_base_user()
+    title, content, last_mod = article.title, article.content, article.last_mod.isoformat()
+
+    response = client.patch(
+        base_url + f"/{title}/{article.id}",
+        content=json.dumps({"title": "newtitle", "last_mod": last_mod}),
+        headers=temp["headers"],
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["title"] == "newtitle"
+    session.expire_all()
+    updated = session.get(Article, article.id)
+    assert updated.title == "newtitle" and updated.content == content
+    assert updated.last_mod.isoformat() > last_mod
+    logger.info("Test patch_article changes only the given columns.")
+
+    response = client.patch(
+        base_url + f"/newtitle/{article.id}",
+        content=json.dumps({"summary": "stale", "last_mod": last_mod}),
+        headers=temp["headers"],
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    logger.info("Test patch_article with a stale last_mod, 409 status.")
+
+    response = client.patch(
+        base_url + f"/{title}/{article.id}",
+        content=json.dumps({"summary": "gone", "last_mod": last_mod}),
+        headers=temp["headers"],
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    logger.info("Test patch_article of a missing article, 404 status.")
+
+
 def test_delete_article(session: Session, client: TestClient, logger):
     article = temp_create_article(session)
     temp = temp_article_base_user()
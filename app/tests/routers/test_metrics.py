@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from ..utils import session_fixture, client_fixture, logger_fixture
+from app import profiling
+from app.config import PROFILE_HEADER
+from app.database import Article, UserLogin, UserPermission, create_user, create_token
+
+
+def sample(text: str, name: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics(session: Session, client: TestClient, logger):
+    session.add(Article(title="title", author="author", content="content", summary="summ"))
+    session.commit()
+    queries = 'http_request_db_queries_sum{method="GET",route="/articles/"}'
+    before = sample(client.get("/metrics").text, queries)
+
+    response = client.get("/articles/", params={"page": 0})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert sample(text, queries) > before
+    assert 'http_requests_total{method="GET",route="/articles/",status="200"}' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/articles/"}' in text
+    assert 'db_query_duration_seconds_count{statement="SELECT"}' in text
+    assert 'cache_lookups_total{cache="response",result="miss"}' in text
+    logger.info("Test metrics exposes request, query and cache numbers.")
+
+
+def test_profile_request(
+    session: Session, client: TestClient, logger, monkeypatch, tmp_path,
+):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    session.add(Article(title="title", author="author", content="content", summary="summ"))
+    session.commit()
+
+    admin = asyncio.run(create_user(
+        UserLogin(username="admin", password="adminpasswd"),
+        permission=UserPermission.admin,
+    ))
+    response = client.get(
+        "/articles/",
+        params={"page": 0},
+        headers={PROFILE_HEADER: "1", "Authorization": create_token(admin)},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    report = os.path.join(tmp_path, response.headers[PROFILE_HEADER])
+    with open(report + ".txt") as file:
+        assert "FROM article" in file.read()
+    assert os.path.exists(report + ".folded")
+    logger.info("Test profiled request writes a report with its statements.")
+
+    response = client.get(
+        "/articles/", params={"page": 0}, headers={PROFILE_HEADER: "1"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert PROFILE_HEADER not in response.headers
+    logger.info("Test profile header is ignored without an admin token.")
@@ -1,28 +1,48 @@
-from fastapi import status
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import jwt
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from ..utils import session_fixture, client_fixture, logger_fixture
+from app.config import (
+    BCRYPT_ROUNDS, USER_CACHE_FILE, USER_CACHE_SLOTS, engine,
+)
 from app.database import (
     UserBase,
     BasePassword,
     UserLogin,
     UserPermission,
     UserInfo,
+    UserPermissionInfo,
+    UserImport,
     create_user,
     create_token,
     auth_token,
+    user_cache,
 )
+from app.database import utils, provision
+from app.database.keys import KeyRing
+from app.database.cache import SharedGenerations
+from app.rotate_keys import rotate
+from app.rate_limit import SQLiteStorage
 
 base_url = "/users"
 
 
 def temp_create_user() -> tuple[UserBase, UserLogin]:
     user_login = UserLogin(username="testuser", password="testpasswd")
-    user = create_user(
+    user = asyncio.run(create_user(
         user_login=user_login,
         permission=UserPermission.admin,
-    )
+    ))
     return (user, user_login)
 
 
@@ -34,7 +54,7 @@ def test_login_user(session: Session, client: TestClient, logger):
         content=user_login.model_dump_json(),
     )
     assert response.status_code == status.HTTP_200_OK
-    assert auth_token(**response.json()) == user
+    assert asyncio.run(auth_token(response.json()["token"])) == user
     logger.info("Test login user, 200 status.")
 
     user_login = UserLogin(username="invalid", password="invalidpasswd")
@@ -46,6 +66,115 @@ def test_login_user(session: Session, client: TestClient, logger):
     logger.info("Test login user, 404 status.")
 
 
+def test_login_limit_shared(session: Session, logger, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'limits.db'}"
+    # two worker processes, each with its own storage over the same file
+    first_worker = FixedWindowRateLimiter(SQLiteStorage(uri))
+    second_worker = FixedWindowRateLimiter(SQLiteStorage(uri))
+    login_limit = parse("3/hour")
+
+    assert first_worker.hit(login_limit, "127.0.0.1")
+    assert second_worker.hit(login_limit, "127.0.0.1")
+    assert first_worker.hit(login_limit, "127.0.0.1")
+    assert not second_worker.hit(login_limit, "127.0.0.1")
+    assert second_worker.hit(login_limit, "10.0.0.1")
+    logger.info("Test login limit is shared between workers.")
+
+
+def test_login_rehash(session: Session, client: TestClient, logger):
+    user_login = UserLogin(username="olduser", password="oldpasswd")
+    session.add(
+        UserBase(
+            username=user_login.username,
+            password_hash=bcrypt.hashpw(
+                user_login.password.encode(), bcrypt.gensalt(4),
+            ),
+        )
+    )
+    session.commit()
+
+    response = client.post(
+        base_url + "/login",
+        content=user_login.model_dump_json(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    session.expire_all()
+    user = session.exec(
+        select(UserBase).where(UserBase.username == user_login.username)
+    ).one()
+    assert user.password_hash.startswith(f"$2b${BCRYPT_ROUNDS}$".encode())
+    logger.info("Test login rehash for old bcrypt cost.")
+
+
+def test_refresh_token(session: Session, client: TestClient, logger):
+    user, user_login = temp_create_user()
+    response = client.post(
+        base_url + "/login",
+        content=user_login.model_dump_json(),
+    )
+    first_refresh = response.json()["refresh_token"]
+
+    response = client.post(
+        base_url + "/refresh", json={"refresh_token": first_refresh},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert asyncio.run(auth_token(response.json()["token"])) == user
+    second_refresh = response.json()["refresh_token"]
+    logger.info("Test refresh token, 200 status.")
+
+    response = client.post(
+        base_url + "/refresh", json={"refresh_token": first_refresh},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    logger.info("Test spent refresh token, 401 status.")
+
+    response = client.put(
+        base_url + "/change-password",
+        headers={"Authorization": create_token(user)},
+        content=BasePassword(password="newpassword").model_dump_json(),
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = client.post(
+        base_url + "/refresh", json={"refresh_token": second_refresh},
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    logger.info("Test refresh token revoked by change_password, 401 status.")
+
+
+def test_token_key_rotation(
+    session: Session, client: TestClient, logger, tmp_path, monkeypatch,
+):
+    path = str(tmp_path / "jwt_keys.json")
+    monkeypatch.setattr(utils, "key_ring", KeyRing(path, check_interval=0))
+    user, _ = temp_create_user()
+
+    old_token = create_token(user)
+    new_kid = rotate(path, keep=2)
+    new_token = create_token(user)
+    assert jwt.get_unverified_header(new_token)["kid"] == new_kid
+    assert asyncio.run(auth_token(old_token)) == user
+    assert asyncio.run(auth_token(new_token)) == user
+    logger.info("Test token signed by the previous key still verifies.")
+
+    rotate(path, keep=1)
+    try:
+        asyncio.run(auth_token(old_token))
+        assert False, "token of a dropped key was accepted"
+    except HTTPException as exc:
+        assert exc.status_code == status.HTTP_401_UNAUTHORIZED
+    logger.info("Test token of a dropped key, 401 status.")
+
+    shared = str(tmp_path / "shared_keys.json")
+    with ThreadPoolExecutor(8) as pool:
+        rings = list(pool.map(lambda _: KeyRing(shared), range(8)))
+    assert len({ring.signing_key() for ring in rings}) == 1
+    assert [path.name for path in tmp_path.iterdir() if "shared" in path.name] == [
+        "shared_keys.json",
+    ]
+    logger.info("Test workers starting together share one key ring.")
+
+
 def test_register_user(session: Session, client: TestClient, logger):
     user_login = UserLogin(username="testuser", password="testpasswd")
 
@@ -62,6 +191,74 @@ def test_register_user(session: Session, client: TestClient, logger):
     logger.info("Test register_user.")
 
 
+def test_bulk_create_users(session: Session, client: TestClient, logger):
+    admin, _ = temp_create_user()
+    body = "\n".join([
+        "username,password,permission,f_name",
+        "bulkuser1,bulkpasswd1,staff,Bulk",
+        "testuser,bulkpasswd2,,",
+        "bulkuser1,bulkpasswd3,,",
+        "bulkuser4,short,,",
+        "bulkuser5,bulkpasswd5,,",
+    ])
+    response = client.post(
+        base_url + "/bulk",
+        headers={"Authorization": create_token(admin)},
+        params={"format": "csv"},
+        content=body,
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert results[-1]["progress"]["created"] == 2
+    # invalid lines are reported first, the rest once their batch is done
+    assert [result["line"] for result in results[:-1]] == [5, 2, 3, 4, 6]
+    assert ["id" in result for result in results[:-1]] == [
+        False, True, False, False, True,
+    ]
+    logger.info("Test bulk_create_users results and duplicates.")
+
+    user = session.exec(
+        select(UserBase).where(UserBase.username == "bulkuser1")
+    ).one()
+    assert user.permission == UserPermission.staff and user.f_name == "Bulk"
+    assert bcrypt.checkpw(b"bulkpasswd1", user.password_hash)
+    logger.info("Test bulk created user can log in.")
+
+    response = client.post(
+        base_url + "/bulk",
+        headers={"Authorization": create_token(user)},
+        content=b"{}",
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    logger.info("Test bulk_create_users is admin only.")
+
+
+def test_bulk_create_users_race(
+    session: Session, logger, monkeypatch,
+):
+    def hash_and_race(passwd: bytes) -> bytes:
+        # another request takes the name after the duplicate check
+        with lock:
+            if not raced:
+                raced.append(UserBase(username="raceduser", password_hash=b"hash"))
+                with Session(engine) as other:
+                    other.add(raced[0])
+                    other.commit()
+        return bcrypt.hashpw(passwd, bcrypt.gensalt(4))
+
+    raced = []
+    lock = threading.Lock()
+    monkeypatch.setattr(provision, "hash_password", hash_and_race)
+    batch = [
+        (1, UserImport(username="raceduser", password="racepasswd")),
+        (2, UserImport(username="calmuser", password="calmpasswd")),
+    ]
+    results = asyncio.run(provision.insert_users(batch))
+    assert results[0] == {"line": 1, "error": "Username already exists."}
+    assert results[1]["line"] == 2 and "id" in results[1]
+    logger.info("Test a username taken while hashing fails only its own line.")
+
+
 def test_change_password(session: Session, client: TestClient, logger):
     user, user_login = temp_create_user()
     token = create_token(user)
@@ -82,6 +279,110 @@ def test_change_password(session: Session, client: TestClient, logger):
     logger.info("Test Change_Password.")
 
 
+def test_change_permission(session: Session, client: TestClient, logger):
+    admin, _ = temp_create_user()
+    user = asyncio.run(create_user(
+        UserLogin(username="staffuser", password="staffpasswd"),
+        UserPermission.staff,
+    ))
+    user_token = create_token(user)
+
+    response = client.get(
+        base_url + "/info", headers={"Authorization": user_token},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    hits = user_cache.hits
+    response = client.get(
+        base_url + "/info", headers={"Authorization": user_token},
+    )
+    assert user_cache.hits == hits + 1
+    logger.info("Test cached user for repeated token.")
+
+    user_perm = UserPermissionInfo(
+        id=user.id, username=user.username, permission=UserPermission.guest,
+    )
+    response = client.put(
+        base_url + "/permission",
+        headers={"Authorization": create_token(admin)},
+        content=user_perm.model_dump_json(),
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert asyncio.run(auth_token(user_token)).permission == UserPermission.guest
+    logger.info("Test change_permission invalidates cached user.")
+
+    # a write through another worker, which maps the same file
+    other_worker = SharedGenerations(USER_CACHE_FILE, USER_CACHE_SLOTS)
+    db_user = session.exec(select(UserBase).where(UserBase.id == user.id)).one()
+    db_user.permission = UserPermission.staff
+    session.add(db_user)
+    session.commit()
+    assert asyncio.run(auth_token(user_token)).permission == UserPermission.guest
+    other_worker.bump(user.id)
+    assert asyncio.run(auth_token(user_token)).permission == UserPermission.staff
+    logger.info("Test a write on another worker invalidates cached user.")
+
+
+def test_users_permission(session: Session, client: TestClient, logger):
+    admin, _ = temp_create_user()
+    for i in range(12):
+        session.add(UserBase(
+            username=f"member{i:02}",
+            password_hash=b"hash",
+            permission=UserPermission.staff if i % 2 else UserPermission.guest,
+        ))
+    session.add(UserBase(username="memberz", password_hash=b"hash"))
+    session.add(UserBase(username="Member", password_hash=b"hash"))
+    session.commit()
+    headers = {"Authorization": create_token(admin)}
+
+    seen = []
+    params = {"prefix": "member", "size": 5}
+    while True:
+        response = client.get(base_url + "/permission", headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        seen += [user["username"] for user in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert seen == [f"member{i:02}" for i in range(12)] + ["memberz"]
+    logger.info("Test users_permission prefix and keyset pagination.")
+
+    response = client.get(
+        base_url + "/permission",
+        headers=headers,
+        params={"prefix": "member", "permission": "staff", "size": 100},
+    )
+    assert [user["username"] for user in response.json()] == [
+        f"member{i:02}" for i in range(1, 12, 2)
+    ]
+    logger.info("Test users_permission permission filter.")
+
+    response = client.get(
+        base_url + "/permission/stream",
+        headers=headers,
+        params={"permission": "guest"},
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    users = [
+        UserPermissionInfo(**json.loads(line))
+        for line in response.text.splitlines()
+    ]
+    assert [user.username for user in users] == (
+        ["Member"] + [f"member{i:02}" for i in range(0, 12, 2)] + ["memberz"]
+    )
+    logger.info("Test users_permission NDJSON stream.")
+
+    user = asyncio.run(create_user(
+        UserLogin(username="guestuser", password="guestpasswd"),
+    ))
+    response = client.get(
+        base_url + "/permission/stream",
+        headers={"Authorization": create_token(user)},
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    logger.info("Test users_permission stream is admin only.")
+
+
 def test_user_info(session: Session, client: TestClient, logger):
     user, user_login = temp_create_user()
     token = create_token(user)
@@ -113,6 +414,32 @@ def test_update_user_info(session: Session, client: TestClient, logger):
     logger.info("Test update_user_info.")
 
 
+def test_patch_user_info(session: Session, client: TestClient, logger):
+    user, _ = temp_create_user()
+    token = create_token(user)
+
+    response = client.patch(
+        base_url + "/info",
+        headers={"Authorization": token},
+        json={"f_name": "first"},
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["f_name"] == "first"
+    assert response.json()["username"] == user.username
+    logger.info("Test patch_user_info changes only the given columns.")
+
+    other = asyncio.run(create_user(
+        UserLogin(username="otheruser", password="otherpasswd"),
+    ))
+    response = client.patch(
+        base_url + "/info",
+        headers={"Authorization": token},
+        json={"username": other.username},
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    logger.info("Test patch_user_info with a taken username, 409 status.")
+
+
 def test_delete_user(session: Session, client: TestClient, logger):
     user, user_login = temp_create_user()
     token = create_token(user)
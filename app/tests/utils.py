@@ -4,7 +4,11 @@ from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, Session
 
 from app import app
-from app.config import engine
+from app.config import engine, limiter
+from app.database import user_cache
+from app.response_cache import response_cache
+from app.view_counter import view_counter
+from app.feeds import feed_cache
 
 
 @pytest.fixture(name="session")
@@ -14,10 +18,15 @@ def session_fixture():
         yield session
 
     SQLModel.metadata.drop_all(engine)
+    user_cache.clear()
+    response_cache.clear()
+    view_counter.clear()
+    feed_cache.clear()
 
 
 @pytest.fixture(name="client")
 def client_fixture():
+    limiter.reset()
     return TestClient(app)
 
 
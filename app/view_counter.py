@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import uuid
+from collections import Counter
+
+from sqlalchemy import Integer, bindparam, exists, select
+from sqlalchemy.dialects.sqlite import insert
+
+from app.config import VIEW_FLUSH_INTERVAL, VIEW_FLUSH_EVENTS
+from app.database import Article, ArticleView, new_session
+from app.database.ids import UUIDBlob
+
+
+logger = logging.getLogger("uvicorn.error").getChild("views")
+
+
+class ViewCounter:
+    # Reads only touch a Counter, the database sees one upsert per article
+    # per flush. Workers count on their own, their flushes add up.
+
+    def __init__(self, interval: float, max_events: int) -> None:
+        self.interval = interval
+        self.max_events = max_events
+        self.counts: Counter[uuid.UUID] = Counter()
+        self.pending = 0
+        self._full: asyncio.Event | None = None
+
+    def add(self, article_id: uuid.UUID) -> None:
+        self.counts[article_id] += 1
+        self.pending += 1
+        if self.pending >= self.max_events and self._full is not None:
+            self._full.set()
+
+    def clear(self) -> None:
+        self.counts.clear()
+        self.pending = 0
+
+    async def flush(self) -> int:
+        counts, self.counts = self.counts, Counter()
+        self.pending = 0
+        if not counts:
+            return 0
+
+        # counts of articles deleted since they were read are dropped, SQLite
+        # does not enforce the foreign key
+        views = ArticleView.__table__
+        article_id = bindparam("article_id", type_=UUIDBlob)
+        statement = insert(views).from_select(
+            [views.c.article_id, views.c.views],
+            select(article_id, bindparam("views", type_=Integer)).
+                where(exists().where(Article.id == article_id)),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[views.c.article_id],
+            set_={"views": views.c.views + statement.excluded.views},
+        )
+        try:
+            async with new_session() as session:
+                await session.exec(statement, params=[
+                    {"article_id": article_id, "views": views}
+                    for article_id, views in counts.items()
+                ])
+                await session.commit()
+        except:
+            # kept for the next flush
+            self.counts.update(counts)
+            self.pending += sum(counts.values())
+            raise
+        return len(counts)
+
+    async def run(self) -> None:
+        self._full = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing article views failed")
+
+
+view_counter = ViewCounter(VIEW_FLUSH_INTERVAL, VIEW_FLUSH_EVENTS)
@@ -0,0 +1,80 @@
+"""Offset against keyset pagination of articles_list on a large table.
+
+    python -m benchmarks.article_pagination --rows 1000000 --pages 1 100 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import SQLModel, Session, create_engine, insert
+
+from app.config import PAGINATION
+from app.database import Article, encode_cursor
+from app.routers.articles import Pagination, articles_page
+
+
+def fill(engine, rows: int, batch: int = 50_000) -> None:
+    start = datetime.now() - timedelta(days=1)
+    with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            conn.execute(insert(Article), [
+                {
+                    "id": uuid.uuid4(),
+                    "title": f"title{i}",
+                    "pub_date": start,
+                    "last_mod": start - timedelta(seconds=i),
+                    "author": f"author{i % 100}",
+                    "content": "content",
+                    "summary": "summary",
+                }
+                for i in range(offset, min(offset + batch, rows))
+            ])
+
+
+def timed(session: Session, pagination: Pagination, repeat: int) -> float:
+    query = articles_page(pagination)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        session.exec(query).all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        print(f"filling {args.rows} articles ...")
+        fill(engine, args.rows)
+
+        with Session(engine) as session:
+            for page in args.pages:
+                offset = (page - 1) * PAGINATION
+                if offset >= args.rows:
+                    continue
+                cursor = None
+                if offset:
+                    last = session.exec(
+                        articles_page(Pagination(page=0, size=1)).offset(offset - 1)
+                    ).one()
+                    cursor = encode_cursor(last.last_mod.isoformat(), last.id)
+
+                by_offset = timed(session, Pagination(page=page - 1), args.repeat)
+                by_cursor = timed(session, Pagination(cursor=cursor), args.repeat)
+                print(
+                    f"page {page:>6}: offset {by_offset:9.3f} ms"
+                    f"  cursor {by_cursor:9.3f} ms"
+                )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
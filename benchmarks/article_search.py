@@ -0,0 +1,89 @@
+"""FTS5 search against a LIKE scan over a generated article corpus.
+
+    python -m benchmarks.article_search --rows 200000 --words 300
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import SQLModel, Session, create_engine, insert, select, or_, func
+
+from app.database import Article
+from app.routers.articles import search_page
+
+
+def vocabulary(size: int) -> list[str]:
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(3, 10)))
+        for _ in range(size)
+    ]
+
+
+def fill(engine, rows: int, words: int, batch: int = 10_000) -> None:
+    rng = random.Random(1)
+    vocab = vocabulary(20_000)
+    # a skewed distribution, like real text
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    pub_date = datetime.now() - timedelta(days=1)
+    with engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            conn.execute(insert(Article), [
+                {
+                    "id": uuid.uuid4(),
+                    "title": " ".join(rng.choices(vocab, cum_weights=weights, k=5)),
+                    "pub_date": pub_date,
+                    "last_mod": pub_date,
+                    "author": "author",
+                    "summary": " ".join(rng.choices(vocab, cum_weights=weights, k=20)),
+                    "content": " ".join(rng.choices(vocab, cum_weights=weights, k=words)),
+                }
+                for _ in range(min(batch, rows - offset))
+            ])
+
+
+def timed(session: Session, query, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        session.exec(query).all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    vocab = vocabulary(20_000)
+    terms = [vocab[10], vocab[1_000], vocab[15_000]]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        print(f"filling {args.rows} articles of {args.words} words ...")
+        start = time.perf_counter()
+        fill(engine, args.rows, args.words)
+        print(f"indexed in {time.perf_counter() - start:.1f} s")
+
+        with Session(engine) as session:
+            for term in terms:
+                fts = timed(session, search_page(term, 10), args.repeat)
+                # ranking needs every match, so the scan can not stop early
+                like = timed(session, select(func.count()).where(or_(
+                    Article.title.contains(term),
+                    Article.summary.contains(term),
+                    Article.content.contains(term),
+                )), args.repeat)
+                print(f"{term:>12}: fts5 {fts:9.3f} ms  like {like:9.3f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
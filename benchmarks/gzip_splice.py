@@ -0,0 +1,68 @@
+"""Time to build a gzip article body from deflate stored content: splicing
+the stored data into a gzip member (gzip_around) against inflating it and
+gzipping the whole body again, as GZipMiddleware would.
+
+    python -m benchmarks.gzip_splice --sizes 1000 50000 500000 --repeat 200
+"""
+import argparse
+import gzip
+import random
+import string
+import time
+
+from app.database.compression import compress_content, content_json, gzip_around
+
+
+def text(size: int) -> str:
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9)))
+        for _ in range(500)
+    ]
+    result = []
+    length = 0
+    while length < size:
+        word = random.choice(words)
+        result.append(word)
+        length += len(word) + 1
+    return " ".join(result)[:size]
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 50_000, 500_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--level", type=int, default=5, help="GZipMiddleware level")
+    args = parser.parse_args()
+
+    head = b'{"id":"0190a1b2-c3d4-7e5f-8a9b-0c1d2e3f4a5b","title":"title",' \
+        b'"pub_date":"2024-01-01T00:00:00","last_mod":"2024-01-01T00:00:00",' \
+        b'"author":"author","content":'
+    tail = b',"summary":"summary"}'
+    for size in args.sizes:
+        stored = compress_content(text(size), "zlib")
+        assert gzip.decompress(gzip_around(head, stored, tail)) == \
+            head + content_json(stored) + tail
+
+        splice = timed(lambda: gzip_around(head, stored, tail), args.repeat)
+        baseline = timed(
+            lambda: gzip.compress(
+                head + content_json(stored) + tail, args.level, mtime=0,
+            ),
+            args.repeat,
+        )
+        print(
+            f"{size:>8} bytes  gzip_around {splice * 1000:7.3f} ms"
+            f"  inflate + gzip {baseline * 1000:7.3f} ms"
+            f"  x{baseline / splice:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Requests per second of list and detail payloads encoded by FastAPI (rows
+validated into the response model, then encoded) against app.fast_json
+(rows encoded as they are).
+
+    python -m benchmarks.json_responses --items 50 --seconds 5
+
+Runs in process over ASGITransport without a database, so the numbers are
+the routing and encoding cost of a response and nothing else.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI, Response
+
+from app.database import ArticleList, ArticleBase, UserPermission, UserPermissionInfo
+from app.fast_json import encode_rows, dumps, orjson
+
+
+ArticleRow = namedtuple("ArticleRow", "author id title last_mod")
+UserRow = namedtuple("UserRow", "id username permission")
+
+
+def payloads(items: int, content_size: int) -> dict:
+    now = datetime.now()
+    return {
+        "ArticleList": (ArticleList, [
+            ArticleRow(f"author{i}", uuid.uuid4(), f"title{i}", now)
+            for i in range(items)
+        ]),
+        "UserPermissionInfo": (UserPermissionInfo, [
+            UserRow(uuid.uuid4(), f"user{i}", list(UserPermission)[i % 3])
+            for i in range(items)
+        ]),
+        "ArticleBase": (ArticleBase, ArticleBase(
+            title="title", author="author", summary="summary" * 10,
+            content="lorem ipsum " * (content_size // 12),
+        )),
+    }
+
+
+def add_routes(app: FastAPI, name: str, model, value) -> None:
+    if isinstance(value, list):
+        @app.get(f"/pydantic/{name}", response_model=list[model])
+        async def pydantic_list():
+            return value
+
+        @app.get(f"/fast/{name}")
+        async def fast_list():
+            return Response(encode_rows(value, model), media_type="application/json")
+    else:
+        @app.get(f"/pydantic/{name}", response_model=model)
+        async def pydantic_detail():
+            return value
+
+        @app.get(f"/fast/{name}")
+        async def fast_detail():
+            return Response(dumps(value.model_dump()), media_type="application/json")
+
+
+def build_app(data: dict) -> FastAPI:
+    app = FastAPI()
+    for name, (model, value) in data.items():
+        add_routes(app, name, model, value)
+    return app
+
+
+async def rate(client: httpx.AsyncClient, path: str, seconds: float) -> float:
+    count = 0
+    stop = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < stop:
+        response = await client.get(path)
+        response.raise_for_status()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+async def run(data: dict, seconds: float) -> None:
+    transport = httpx.ASGITransport(app=build_app(data))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in data:
+            slow = (await client.get(f"/pydantic/{name}")).json()
+            fast = (await client.get(f"/fast/{name}")).json()
+            assert slow == fast, name
+
+            pydantic_rate = await rate(client, f"/pydantic/{name}", seconds)
+            fast_rate = await rate(client, f"/fast/{name}", seconds)
+            print(
+                f"{name:<20} pydantic {pydantic_rate:>8.0f} req/s"
+                f"  fast_json {fast_rate:>8.0f} req/s"
+                f"  x{fast_rate / pydantic_rate:.2f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--content-size", type=int, default=20_000)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{args.items} items per list, {args.content_size} bytes of content,"
+        f" encoder {'orjson' if orjson is not None else 'json'}"
+    )
+    asyncio.run(run(payloads(args.items, args.content_size), args.seconds))
+
+
+if __name__ == "__main__":
+    main()
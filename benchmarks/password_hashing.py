@@ -0,0 +1,41 @@
+"""Hashes per second of the bcrypt worker pool for a range of pool sizes.
+
+    python -m benchmarks.password_hashing --rounds 12 --hashes 64 --sizes 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.database.hashing import PasswordPool, hash_password
+
+
+async def run(pool: PasswordPool, hashes: int, rounds: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        pool.run(hash_password, b"benchmark-password", rounds)
+        for _ in range(hashes)
+    ))
+    return hashes / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--hashes", type=int, default=64)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+    )
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds={args.rounds}, {args.hashes} hashes per size")
+    for size in args.sizes:
+        pool = PasswordPool(size, queue_limit=args.hashes)
+        rate = asyncio.run(run(pool, args.hashes, args.rounds))
+        pool.shutdown()
+        print(f"workers={size:>3}  {rate:8.1f} hashes/s")
+
+
+if __name__ == "__main__":
+    main()
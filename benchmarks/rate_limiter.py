@@ -0,0 +1,61 @@
+"""Cost of one rate limit hit with in-memory counters against the shared
+SQLite storage, from one process and from several at once.
+
+    python -m benchmarks.rate_limiter --hits 20000 --clients 1000 --processes 1 4
+
+With several processes the memory storage counts each one on its own, which
+is the bug the SQLite storage fixes, so its numbers are only a floor.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+import app.rate_limit  # registers the sqlite:// storage
+
+
+def run(uri: str, hits: int, clients: int) -> float:
+    limiter = FixedWindowRateLimiter(storage_from_string(uri))
+    limit = parse("1000000/hour")
+
+    start = time.perf_counter()
+    for i in range(hits):
+        limiter.hit(limit, f"10.0.{i % clients // 256}.{i % 256}")
+    return (time.perf_counter() - start) / hits
+
+
+def run_processes(uri: str, hits: int, clients: int, processes: int) -> float:
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.starmap(run, [(uri, hits, clients)] * processes)
+    return sum(results) / len(results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hits", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        storages = {
+            "memory": "memory://",
+            "sqlite": f"sqlite:///{os.path.join(directory, 'limits.db')}",
+        }
+        print(f"{args.hits} hits per process over {args.clients} client keys")
+        for processes in args.processes:
+            for name, uri in storages.items():
+                seconds = run_processes(uri, args.hits, args.clients, processes)
+                print(
+                    f"processes={processes:>3}  {name:<7}"
+                    f"{seconds * 1_000_000:8.1f} us/hit"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Requests per second of GET /articles/ with 1 worker against N workers.
+
+    python -m benchmarks.server_throughput --workers 1 4 --seconds 10 --concurrency 64
+
+The load generator is a single asyncio process, give it a core of its own
+when comparing large worker counts.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def load(url: str, seconds: float, concurrency: int) -> list[float]:
+    latencies = []
+    stop = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def user() -> None:
+            while time.perf_counter() < stop:
+                start = time.perf_counter()
+                response = await client.get(url, params={"page": 0})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies
+
+
+def seed(database: str, rows: int) -> None:
+    os.environ["APP_DATABASE"] = database
+    from sqlmodel import Session
+    from app.config import engine
+    from app.database import Article
+    from app.main import init_database
+
+    with engine.begin() as conn:
+        init_database(conn)
+    with Session(engine) as session:
+        for i in range(rows):
+            session.add(Article(
+                title=f"title{i}", author="author", content="content",
+                summary="summary",
+            ))
+        session.commit()
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, "bench.db")
+        seed(database, 100)
+        url = f"http://127.0.0.1:{args.port}/articles/"
+
+        for workers in args.workers:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "app"],
+                env={
+                    **os.environ,
+                    "APP_DATABASE": database,
+                    "APP_PORT": str(args.port),
+                    "APP_WORKERS": str(workers),
+                },
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                asyncio.run(wait_ready(url))
+                latencies = asyncio.run(load(url, args.seconds, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+
+            p99 = statistics.quantiles(latencies, n=100)[98] * 1000
+            print(
+                f"workers={workers:>3}  {len(latencies) / args.seconds:8.1f} req/s"
+                f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+                f"  p99 {p99:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Read and write throughput of concurrent clients with and without the
+SQLite tuning profile (SQLITE_PRAGMAS and SQLITE_POOL in app.config).
+
+    python -m benchmarks.sqlite_tuning --seconds 5 --readers 8 --writers 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import SQLITE_POOL, tune_sqlite
+from app.database import Article
+from app.routers.articles import Pagination, articles_page
+
+
+async def reader(engine, stop: float, counts: dict) -> None:
+    while time.perf_counter() < stop:
+        async with AsyncSession(engine) as session:
+            await session.exec(articles_page(Pagination()))
+            await session.exec(select(Article).limit(1))
+        counts["reads"] += 1
+
+
+async def writer(engine, stop: float, counts: dict) -> None:
+    while time.perf_counter() < stop:
+        async with AsyncSession(engine) as session:
+            session.add(Article(
+                title="title", author="author", content="content" * 50,
+                summary="summary",
+            ))
+            try:
+                await session.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+
+async def run(tuned: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        if tuned:
+            engine = create_async_engine(url, **SQLITE_POOL)
+            tune_sqlite(engine.sync_engine)
+        else:
+            engine = create_async_engine(url)
+
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+        counts = {"reads": 0, "writes": 0, "locked": 0}
+        stop = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(reader(engine, stop, counts) for _ in range(args.readers)),
+            *(writer(engine, stop, counts) for _ in range(args.writers)),
+        )
+        await engine.dispose()
+        return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    for tuned in (False, True):
+        counts = asyncio.run(run(tuned, args))
+        print(
+            f"{'tuned' if tuned else 'default':>8}: "
+            f"{counts['reads'] / args.seconds:8.1f} reads/s "
+            f"{counts['writes'] / args.seconds:8.1f} writes/s "
+            f"{counts['locked']:>5} locked errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
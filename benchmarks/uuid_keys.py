@@ -0,0 +1,116 @@
+"""Insert rate, lookup rate and size of random text keys (uuid4 as 32 hex
+characters, the old layout) against time ordered 16 byte keys (uuid7 BLOBs).
+
+    python -m benchmarks.uuid_keys --rows 10000000 --lookups 100000
+
+Each layout gets its own database file in a temporary directory, with the
+PRAGMAs of the application. The insert rate of the last tenth of the rows
+shows how random keys slow down once the index outgrows the page cache.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from app.config import SQLITE_PRAGMAS
+from app.database.ids import uuid7
+
+
+LAYOUTS = {
+    "uuid4 text": ("CHAR(32)", lambda: uuid.uuid4().hex),
+    "uuid7 blob": ("BLOB", lambda: uuid7().bytes),
+}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None)
+    for name, value in SQLITE_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def run(path: str, column_type: str, new_id, rows: int, batch: int, lookups: int):
+    conn = connect(path)
+    conn.execute(
+        f"CREATE TABLE article (id {column_type} NOT NULL PRIMARY KEY, summary TEXT)"
+    )
+    summary = "x" * 100
+    # every n-th id is kept for the lookups
+    step = max(rows // lookups, 1)
+    sample = []
+    insert_seconds = 0.0
+    tail_seconds = 0.0
+    tail_rows = 0
+    tail_start = rows - rows // 10
+
+    for start in range(0, rows, batch):
+        ids = [new_id() for _ in range(min(batch, rows - start))]
+        sample.extend(ids[::step])
+        begin = time.perf_counter()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO article (id, summary) VALUES (?, ?)",
+            ((key, summary) for key in ids),
+        )
+        conn.execute("COMMIT")
+        elapsed = time.perf_counter() - begin
+        insert_seconds += elapsed
+        # every batch reaching into the last tenth, at least the last one
+        if start + len(ids) > tail_start:
+            tail_seconds += elapsed
+            tail_rows += len(ids)
+
+    random.shuffle(sample)
+    begin = time.perf_counter()
+    for key in sample:
+        conn.execute("SELECT summary FROM article WHERE id = ?", (key,)).fetchone()
+    lookup_seconds = time.perf_counter() - begin
+
+    sizes = dict(conn.execute(
+        "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+    ).fetchall())
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return {
+        "insert": rows / insert_seconds,
+        "insert_tail": tail_rows / tail_seconds if tail_seconds else 0.0,
+        "lookup": len(sample) / lookup_seconds,
+        "table": sizes.get("article", 0),
+        # the separate index SQLite makes for a non integer primary key
+        "index": sum(
+            size for name, size in sizes.items() if name.startswith("sqlite_autoindex")
+        ),
+        "file": os.path.getsize(path),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    mib = 1024 * 1024
+    print(f"{args.rows} rows, {args.lookups} random lookups")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (column_type, new_id) in LAYOUTS.items():
+            path = os.path.join(directory, f"{name.replace(' ', '_')}.db")
+            result = run(
+                path, column_type, new_id, args.rows, args.batch, args.lookups,
+            )
+            print(
+                f"{name}  insert {result['insert']:>9.0f} rows/s"
+                f" (last tenth {result['insert_tail']:>9.0f})"
+                f"  lookup {result['lookup']:>8.0f}/s"
+                f"  table {result['table'] / mib:7.1f} MiB"
+                f"  index {result['index'] / mib:7.1f} MiB"
+                f"  file {result['file'] / mib:7.1f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()